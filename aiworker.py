@@ -0,0 +1,129 @@
+import math
+import queue
+import threading
+import time
+from chessboard import Chessboard
+from fiancoai import FiancoAI
+from moves import decode_move, mirror_move
+
+class AIWorker:
+    """
+        Runs the AI in a background thread so the pygame loop keeps drawing and reading input
+
+        The search works on a private copy of the position and posts its move to a queue,
+        which the UI loop polls once per frame. Every start or cancel bumps a generation
+        counter, so a move from a cancelled search is dropped instead of being played.
+
+        Between its moves the AI can ponder: search, without a time limit, the position after
+        the reply it expects. If that reply is played, start() lets the running search go on
+        with a fresh time budget; otherwise the search is cancelled and only the transposition
+        table entries it stored are kept.
+
+        Attributes:
+        - ai: FiancoAI searching the private board
+        - results: Queue of (generation, zobrist_hash, move) posted by the search thread
+        - generation: Number of the search whose result is still wanted
+        - thread: Thread of the running search, or None
+        - pondering: Zobrist hash of the position searched while pondering, or None
+        - time_limit, node_limit: Limits of a normal search, lifted while pondering
+    """
+    def __init__(self, **config):
+        self.ai = FiancoAI(None, 0, **config)
+        self.results = queue.Queue()
+        self.generation = 0
+        self.thread = None
+        self.pondering = None
+        self.time_limit, self.node_limit = self.ai.time_limit, self.ai.node_limit
+
+    @property
+    def thinking(self):
+        """ Whether a search for the position on the board is running, pondering excluded """
+        return self.thread is not None and self.pondering is None
+
+    def start(self, chessboard):
+        """ Start searching for the player to move on chessboard, or take over the ponder search of that position """
+        if self.pondering is not None and self.pondering == chessboard.zobrist_hash:
+            # Ponder hit: the search already runs on this position, from now on with the normal limits
+            self.pondering = None
+            self.ai.time_limit, self.ai.node_limit = self.time_limit, self.ai.nodes + self.node_limit
+            self.ai.deadline = time.perf_counter() + self.time_limit
+            return
+        self.search(Chessboard.from_bitboards(chessboard.white_pieces, chessboard.black_pieces, chessboard.player))
+
+    def ponder(self, chessboard):
+        """ Search the expected reply to the AI move just played on chessboard until start() or cancel()
+
+            The reply is the best move the transposition table holds for the position. Without
+            one the position itself is searched for the opponent, which still fills the table.
+        """
+        if self.ai.mode not in ('search', 'mcts'):
+            return  # The other modes cannot be stopped or extended while they run
+        board = Chessboard.from_bitboards(chessboard.white_pieces, chessboard.black_pieces, chessboard.player)
+        if not board.legal_moves or board.check_winner():
+            return
+        reply = self.expected_reply(board)
+        if reply:
+            board.make_move(reply)
+            if not board.legal_moves or board.check_winner():
+                return
+        self.search(board, math.inf, math.inf)
+        self.pondering = board.zobrist_hash
+
+    def expected_reply(self, board):
+        """ Legal encoded move stored in the transposition table for board, or 0 """
+        table = self.ai.table
+        if not table:
+            return 0
+        key, mirrored = board.canonical_hash()
+        entry = table.probe(key ^ self.ai.table_salt)
+        if not entry:
+            return 0
+        move = mirror_move(entry[0]) if mirrored else entry[0]
+        return move if decode_move(move) in board.legal_moves else 0
+
+    def search(self, board, time_limit=None, node_limit=None):
+        """ Search board in a new thread, with the normal limits unless others are given """
+        self.cancel()
+        self.generation += 1
+        self.ai.chessboard = board
+        self.ai.color = board.player
+        self.ai.stopped = False
+        self.ai.nodes = self.ai.completed_depth = 0
+        self.ai.time_limit = self.time_limit if time_limit is None else time_limit
+        self.ai.node_limit = self.node_limit if node_limit is None else node_limit
+        self.thread = threading.Thread(target=self.run, args=(self.generation, board.zobrist_hash), daemon=True)
+        self.thread.start()
+
+    def run(self, generation, zobrist_hash):
+        self.results.put((generation, zobrist_hash, self.ai.get_move()))
+
+    def cancel(self):
+        """ Stop the running search and discard its move, e.g. on undo or reset """
+        if self.thread is not None:
+            self.ai.stop()
+            self.thread.join()
+            self.thread = None
+            self.pondering = None
+            self.generation += 1
+
+    def poll(self, chessboard):
+        """ Return the finished (y0, x0, y1, x1) move for chessboard, or None while still thinking """
+        if self.pondering is not None:
+            return None
+        while True:
+            try:
+                generation, zobrist_hash, move = self.results.get_nowait()
+            except queue.Empty:
+                return None
+            if generation == self.generation and zobrist_hash == chessboard.zobrist_hash:
+                self.thread = None
+                return move
+
+    def progress(self):
+        """ Status line with the live depth and node count of the running search """
+        return f"AI is thinking... depth {self.ai.completed_depth + 1}, {self.ai.nodes} nodes"
+
+    def close(self):
+        self.cancel()
+        if self.ai.parallel is not None:
+            self.ai.parallel.close()
@@ -0,0 +1,136 @@
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import time
+from chessboard import Chessboard
+from fiancoai import FiancoAI
+from gamerecord import GameRecordWriter
+from searchstats import SearchStats
+from parameters import *
+import transpositiontable
+
+# Set per worker: a table mapped from a file is shared by all workers and kept between games
+shared_table = False
+# Set per worker: file the search statistics of every move are appended to, or None
+stats_output = None
+
+def init_worker(tt_size_mb, tt_file=None, stats_file=None):
+    """ Give every worker process its own transposition table, or map the shared table file """
+    global shared_table, stats_output
+    shared_table = bool(tt_file)
+    transpositiontable.init_table(tt_size_mb, tt_file)
+    if stats_file:
+        stats_output = open(stats_file, 'a')
+
+def play_game(game):
+    """ Play one game and return its result as a dict
+
+        game is (index, engine configs, seed, opening plies, max moves). Games are played in
+        pairs: both games of a pair start from the same random opening with colors swapped.
+    """
+    index, configs, seed, opening_plies, max_moves = game
+    rng = random.Random(seed + index // 2)
+    white_engine = index % 2  # Engine 0 plays white in even games
+    board = Chessboard()
+    if not shared_table:
+        transpositiontable.clear_table()
+    engines = {
+        1: FiancoAI(board, 1, **configs[white_engine]),
+        2: FiancoAI(board, 2, **configs[1 - white_engine]),
+    }
+    if stats_output:
+        for player, engine in ((1, white_engine), (2, 1 - white_engine)):
+            engines[player].stats = SearchStats(stats_output, game=index, engine=engine)
+    think_time = {1: 0.0, 2: 0.0}
+    moves_made = {1: 0, 2: 0}
+    opening = []
+    winner = 0
+
+    for ply in range(max_moves):
+        player = board.player
+        if ply < opening_plies:
+            moves = sorted(board.legal_moves)
+            move = rng.choice(moves) if moves else None
+            if move:
+                opening.append(move)
+        else:
+            start = time.perf_counter()
+            move = engines[player].get_move()
+            think_time[player] += time.perf_counter() - start
+            moves_made[player] += 1
+        if move is None:
+            winner = player ^ 3  # A player that cannot move loses
+            break
+        board.move(player, move[:2], move[2:])
+        if move[2] == (BOARD_SIZE - 1 if player == 1 else 0):
+            winner = player
+            break
+
+    engine_of = {1: white_engine, 2: 1 - white_engine}
+    return {
+        'game': index,
+        'white': engine_of[1],
+        'black': engine_of[2],
+        'winner': winner,
+        'winner_engine': engine_of[winner] if winner else None,
+        'moves': len(board.history),
+        'opening': opening,
+        'time_per_move': {engine_of[player]: think_time[player] / max(moves_made[player], 1) for player in (1, 2)},
+        'record': board.history.moves_played().tolist(),
+    }
+
+def run_arena(configs, games, output, processes=None, seed=SEED, opening_plies=4, max_moves=200, tt_size_mb=16, tt_file=None, records=None, stats_file=None):
+    """ Play games between two engine configurations on a process pool, streaming results to output as JSON lines
+
+        With tt_file all workers share one persistent table of tt_size_mb, reused by later runs.
+        Engines with different weights never read each other's entries, see FiancoAI.table_salt.
+        With records the moves of every game are appended to that game record file.
+        With stats_file the search statistics of every engine move are appended to it as JSON lines.
+    """
+    jobs = [(index, configs, seed, opening_plies, max_moves) for index in range(games)]
+    if tt_file:
+        # Create or reset the file once here, so the workers never race to do it
+        transpositiontable.open_table(tt_file, tt_size_mb)
+    wins, draws = [0, 0], 0
+    with multiprocessing.Pool(processes or os.cpu_count(), initializer=init_worker, initargs=(tt_size_mb, tt_file, stats_file)) as pool, \
+            open(output, 'a') as results:
+        writer = GameRecordWriter(records) if records else None
+        for finished, result in enumerate(pool.imap_unordered(play_game, jobs), 1):
+            record = result.pop('record')
+            if writer:
+                writer.write_game(record, result['winner'])
+            results.write(json.dumps(result) + '\n')
+            results.flush()
+            if result['winner_engine'] is None:
+                draws += 1
+            else:
+                wins[result['winner_engine']] += 1
+            print(f"\r{finished}/{games} games  engine 0: {wins[0]}  engine 1: {wins[1]}  draws: {draws}", end='', flush=True)
+    print()
+    if writer:
+        writer.close()
+    return wins, draws
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless self-play between two FiancoAI configurations")
+    parser.add_argument('--engine0', default='{}', help="FiancoAI keyword arguments as JSON, e.g. '{\"time_limit\": 0.5}'")
+    parser.add_argument('--engine1', default='{}')
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--output', default='arena_results.jsonl')
+    parser.add_argument('--processes', type=int, default=None, help="worker processes, all cores by default")
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--opening-plies', type=int, default=4, help="random plies played before the engines take over")
+    parser.add_argument('--max-moves', type=int, default=200, help="plies after which the game is scored as a draw")
+    parser.add_argument('--tt-mb', type=int, default=16, help="transposition table size per worker")
+    parser.add_argument('--records', default=None, help="game record file the moves of every game are appended to")
+    parser.add_argument('--stats', default=None, help="file the search statistics of every move are appended to as JSON lines")
+    parser.add_argument('--tt-file', default=None, help="transposition table file shared by the workers and kept between runs")
+    args = parser.parse_args()
+
+    configs = [json.loads(args.engine0), json.loads(args.engine1)]
+    run_arena(configs, args.games, args.output, args.processes, args.seed, args.opening_plies, args.max_moves, args.tt_mb, args.tt_file, args.records, args.stats)
+
+if __name__ == "__main__":
+    main()
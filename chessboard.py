@@ -1,9 +1,29 @@
 import numpy as np
 from parameters import *
-from collections import deque
+from history import MoveHistory, NO_CAPTURE
+from moves import *
+from tables import *
 import sys
 import random
 
+def init_zobrist_table(seed=SEED):
+    """ Per-square keys for each color and one key per player to move, seeded for repeatable hashes
+
+        The mirror keys are the color keys of the mirrored squares: they update the hash of
+        the mirror image of the position.
+    """
+    rng = random.Random(seed)
+    table = {
+        'white': [rng.getrandbits(64) for _ in range(BOARD_SIZE * BOARD_SIZE)],
+        'black': [rng.getrandbits(64) for _ in range(BOARD_SIZE * BOARD_SIZE)],
+        'player': [rng.getrandbits(64), rng.getrandbits(64)]
+    }
+    for color in ('white', 'black'):
+        table[color + '_mirror'] = [table[color][MIRROR_SQUARE[square]] for square in range(BOARD_SIZE * BOARD_SIZE)]
+    return table
+
+ZOBRIST_TABLE = init_zobrist_table()
+
 class Chessboard:
     """ 
         Class to represent the state of the chessboard and game logic 
@@ -13,8 +33,11 @@ class Chessboard:
         - black_pieces: Bitboard representing the positions of black pieces
         - empty_squares: Bitboard representing the empty squares
         - player: Current player's turn
-        - legal_moves: Set of legal moves for the current player
-        - previous: Deque to store the previous board states for undo functionality
+        - legal_moves: Set of legal moves for the current player as (y0, x0, y1, x1) tuples, built on first use in each position
+        - legal_snapshots: (position, legal move set) before every move() still on the history, so undo() restores the set as is
+        - history: MoveHistory of the moves played, used by undo
+        - zobrist_hash: Zobrist hash of the position, updated incrementally by move/undo
+        - mirror_hash: Zobrist hash of the position mirrored in the middle file, updated the same way
         
     """
     # Movement and capture patterns
@@ -30,7 +53,7 @@ class Chessboard:
     def __init__(self):
         self.white_pieces = 0
         self.black_pieces = 0
-        self.empty_squares = (1 << (BOARD_SIZE * BOARD_SIZE)) - 1
+        self.empty_squares = FULL_BOARD
 
         # Initialize pieces
         for col in range(BOARD_SIZE):
@@ -51,150 +74,235 @@ class Chessboard:
         self.empty_squares &= ~(self.white_pieces | self.black_pieces)
 
         self.player = 1
-        self.legal_moves = set(INITIAL_LEGAL_MOVES)
-        self.previous = deque(maxlen=MAX_HISTORY)
-        self.table = {
-                        'white': random.getrandbits(64),
-                        'black': random.getrandbits(64),
-                        'player': [random.getrandbits(64), random.getrandbits(64)]  
-                        }
-        
-    def get_bitboard_position(self, y, x):
-        return 1 << (y * BOARD_SIZE + x)
-
-    def legalmoves(self):
-        self.legal_moves.clear()
-        capture_moves = set()
-        directions = self.MOVEMENT_DIRECTIONS[self.player]
-        capture_patterns = self.CAPTURE_PATTERNS[self.player]
-
-        pieces = self.white_pieces if self.player == 1 else self.black_pieces
-        opponent_pieces = self.black_pieces if self.player == 1 else self.white_pieces
-
-        # Iterate over all pieces' bitboard
-        while pieces:
-            piece = pieces & -pieces  # Extract rightmost 1-bit
-            pieces ^= piece  # Remove the bit from the bitboard
-
-            piece_index = (piece.bit_length() - 1)  # Get the index of the bit
-            y, x = divmod(piece_index, BOARD_SIZE)
-
-            # Generate possible move and capture positions
-            for dy, dx in directions:
-                ny, nx = y + dy, x + dx
-                if 0 <= ny < BOARD_SIZE and 0 <= nx < BOARD_SIZE:
-                    move_pos = self.get_bitboard_position(ny, nx)
-                    if self.empty_squares & move_pos:
-                        self.legal_moves.add((y, x, ny, nx))
-
-            for dy, dx in capture_patterns:
-                ny, nx = y + dy, x + dx
-                my, mx = y + dy // 2, x + dx // 2
-                if 0 <= ny < BOARD_SIZE and 0 <= nx < BOARD_SIZE:
-                    capture_pos = self.get_bitboard_position(ny, nx)
-                    mid_pos = self.get_bitboard_position(my, mx)
-                    if (opponent_pieces & mid_pos) and (self.empty_squares & capture_pos):
-                        capture_moves.add((y, x, ny, nx))
-
-        if capture_moves:
-            self.legal_moves = capture_moves
-
-    def undo(self):
-        if self.previous:
-            self.player ^= 3  # Switch back to the previous player
+        self.legal_key = (self.white_pieces, self.black_pieces, self.player)
+        self.legal_cache = set(INITIAL_LEGAL_MOVES)
+        self.legal_snapshots = []
+        self.move_buffer = new_move_list()
+        self.history = MoveHistory()
+        self.table = ZOBRIST_TABLE
+        self.zobrist_hash = self.compute_zobrist_hash()
+        self.mirror_hash = self.compute_mirror_hash()
+
+    @classmethod
+    def from_bitboards(cls, white_pieces, black_pieces, player):
+        """ Create a board for an arbitrary position, with an empty history """
+        board = cls()
+        board.set_position(white_pieces, black_pieces, player)
+        return board
+
+    def set_position(self, white_pieces, black_pieces, player):
+        self.white_pieces = white_pieces
+        self.black_pieces = black_pieces
+        self.empty_squares = FULL_BOARD & ~(white_pieces | black_pieces)
+        self.player = player
+        self.history.clear()
+        self.zobrist_hash = self.compute_zobrist_hash()
+        self.mirror_hash = self.compute_mirror_hash()
+        self.legal_snapshots.clear()
 
-            # Retrieve the last bitboard differences
-            white_diff, black_diff, empty_diff = self.previous.pop()
+    def get_bitboard_position(self, y, x):
+        return SQUARE_BIT[y * BOARD_SIZE + x]
 
-            # Apply the bitwise difference to reverse the board state
-            self.white_pieces ^= white_diff
-            self.black_pieces ^= black_diff
-            self.empty_squares ^= empty_diff
+    @property
+    def legal_moves(self):
+        """ The (y0, x0, y1, x1) form of generate_moves used by the front ends
 
-            # Update legal moves after undo
+            The set is kept for the position it was built in: searching with make_move and
+            undo_no_check and coming back does not rebuild it, and moves nobody looks at are
+            never decoded. Treat it as read-only, undo() may bring it back.
+        """
+        if self.legal_key != (self.white_pieces, self.black_pieces, self.player):
             self.legalmoves()
+        return self.legal_cache
 
-    def move_no_check(self, player, y0, x0, y1, x1):
-        white_initial, black_initial, empty_initial = self.white_pieces, self.black_pieces, self.empty_squares
-        bit_pos_from, bit_pos_to = self.get_bitboard_position(y0, x0), self.get_bitboard_position(y1, x1)
-        shift = bit_pos_from | bit_pos_to
+    def legalmoves(self):
+        """ Rebuild legal_moves for the current position and return it """
+        moves = self.move_buffer
+        count = self.generate_moves(moves)
+        self.legal_key = (self.white_pieces, self.black_pieces, self.player)
+        self.legal_cache = {decode_move(moves[i]) for i in range(count)}
+        return self.legal_cache
+
+    def capture_targets(self):
+        """ Target bitboards of the current player's captures, each paired with the offset back to the start square """
+        empty = self.empty_squares
+        if self.player == 1:
+            pieces, opponent_pieces = self.white_pieces, self.black_pieces
+            # Captures: jump over an opponent piece diagonally downwards
+            return (
+                (((pieces & NOT_LAST_TWO_FILES) << (BOARD_SIZE + 1) & opponent_pieces) << (BOARD_SIZE + 1) & empty, -2 * (BOARD_SIZE + 1)),
+                (((pieces & NOT_FIRST_TWO_FILES) << (BOARD_SIZE - 1) & opponent_pieces) << (BOARD_SIZE - 1) & empty, -2 * (BOARD_SIZE - 1)),
+            )
+        pieces, opponent_pieces = self.black_pieces, self.white_pieces
+        # Captures: jump over an opponent piece diagonally upwards
+        return (
+            (((pieces & NOT_LAST_TWO_FILES) >> (BOARD_SIZE - 1) & opponent_pieces) >> (BOARD_SIZE - 1) & empty, 2 * (BOARD_SIZE - 1)),
+            (((pieces & NOT_FIRST_TWO_FILES) >> (BOARD_SIZE + 1) & opponent_pieces) >> (BOARD_SIZE + 1) & empty, 2 * (BOARD_SIZE + 1)),
+        )
+
+    def quiet_targets(self):
+        """ Target bitboards of the current player's quiet moves, each paired with the offset back to the start square """
+        empty = self.empty_squares
+        if self.player == 1:
+            pieces = self.white_pieces
+            forward = ((pieces << BOARD_SIZE) & empty, -BOARD_SIZE)
+        else:
+            pieces = self.black_pieces
+            forward = ((pieces >> BOARD_SIZE) & empty, BOARD_SIZE)
+        return (
+            forward,
+            (((pieces & NOT_LAST_FILE) << 1) & empty, -1),
+            (((pieces & NOT_FIRST_FILE) >> 1) & empty, 1),
+        )
+
+    def generate_moves(self, moves):
+        """ Write the encoded legal moves of the current player into moves and return their number
+
+            All quiet-move and capture targets are computed with whole-board shifts, then expanded.
+        """
+        # Captures are mandatory, quiet moves are only generated without them
+        targets = self.capture_targets()
+        if targets[0][0] or targets[1][0]:
+            return self.expand_targets(targets, CAPTURE_FLAG, moves)
+        return self.expand_targets(self.quiet_targets(), 0, moves)
+
+    def generate_captures(self, moves):
+        """ Write only the encoded captures into moves and return their number, for the quiescence search """
+        return self.expand_targets(self.capture_targets(), CAPTURE_FLAG, moves)
+
+    def has_captures(self):
+        return any(bitboard for bitboard, _ in self.capture_targets())
+
+    def has_quiet_moves(self):
+        return any(bitboard for bitboard, _ in self.quiet_targets())
+
+    def expand_targets(self, targets, flag, moves):
+        """ Expand (target bitboard, offset) pairs into encoded moves written to moves, returns their number """
+        count = 0
+        for bitboard, offset in targets:
+            while bitboard:
+                bit = bitboard & -bitboard
+                bitboard ^= bit
+                to_square = bit.bit_length() - 1
+                moves[count] = (to_square + offset) | to_square << TO_SHIFT | flag
+                count += 1
+        return count
 
-        if player == 1:
+    def undo(self):
+        """ Take back the last move if the history still holds it, returns whether a move was taken back """
+        if self.history:
+            self.undo_no_check()
+
+            # Restore the legal moves saved by move(), if the move taken back was played by it
+            snapshots = self.legal_snapshots
+            if snapshots and snapshots[-1][0] == (self.white_pieces, self.black_pieces, self.player):
+                self.legal_key, self.legal_cache = snapshots.pop()
+            return True
+        return False
+
+    def undo_no_check(self):
+        """ Take back the last move without regenerating legal moves, the counterpart of move_no_check """
+        self.player ^= 3  # Switch back to the previous player
+        move, captured, self.zobrist_hash, self.mirror_hash = self.history.pop()
+
+        # Move the piece back and put a captured piece back on the board
+        shift = SQUARE_BIT[move & SQUARE_MASK] | SQUARE_BIT[(move >> TO_SHIFT) & SQUARE_MASK]
+        if self.player == 1:
             self.white_pieces ^= shift
         else:
             self.black_pieces ^= shift
-
-        if abs(y1 - y0) == 2:
-            mid_pos = self.get_bitboard_position((y0 + y1) // 2, (x0 + x1) // 2)
-            if player == 1:
-                self.black_pieces &= ~mid_pos
+        if captured != NO_CAPTURE:
+            captured_pos = SQUARE_BIT[captured]
+            if self.player == 1:
+                self.black_pieces |= captured_pos
             else:
-                self.white_pieces &= ~mid_pos
-            self.empty_squares |= mid_pos
-
+                self.white_pieces |= captured_pos
+            shift |= captured_pos
         self.empty_squares ^= shift
-        self.previous.append((self.white_pieces ^ white_initial, self.black_pieces ^ black_initial, self.empty_squares ^ empty_initial))
+
+    def move_no_check(self, player, y0, x0, y1, x1):
+        """ Play (y0, x0, y1, x1) for player, who must be the player to move, without checking legality """
+        self.make_move(encode_move(y0, x0, y1, x1))
+
+    def make_move(self, move):
+        """ Play an encoded move for the player to move without checking legality or regenerating moves """
+        from_square = move & SQUARE_MASK
+        to_square = (move >> TO_SHIFT) & SQUARE_MASK
+        shift = SQUARE_BIT[from_square] | SQUARE_BIT[to_square]
+        table = self.table
+        player_keys = table['player']
+
+        if self.player == 1:
+            own_keys, opponent_keys = table['white'], table['black']
+            own_mirror_keys, opponent_mirror_keys = table['white_mirror'], table['black_mirror']
+            white_diff, black_diff = shift, 0
+        else:
+            own_keys, opponent_keys = table['black'], table['white']
+            own_mirror_keys, opponent_mirror_keys = table['black_mirror'], table['white_mirror']
+            white_diff, black_diff = 0, shift
+        empty_diff = shift
+        player_diff = player_keys[0] ^ player_keys[1]
+        hash_diff = own_keys[from_square] ^ own_keys[to_square] ^ player_diff
+        mirror_diff = own_mirror_keys[from_square] ^ own_mirror_keys[to_square] ^ player_diff
+        mid_square = NO_CAPTURE
+
+        if move & CAPTURE_FLAG:
+            # Remove the jumped-over piece
+            mid_square = (from_square + to_square) >> 1
+            mid_pos = SQUARE_BIT[mid_square]
+            if self.player == 1:
+                black_diff = mid_pos
+            else:
+                white_diff = mid_pos
+            empty_diff |= mid_pos
+            hash_diff ^= opponent_keys[mid_square]
+            mirror_diff ^= opponent_mirror_keys[mid_square]
+
+        self.history.push(move, mid_square, self.zobrist_hash, self.mirror_hash)
+        self.white_pieces ^= white_diff
+        self.black_pieces ^= black_diff
+        self.empty_squares ^= empty_diff
+        self.zobrist_hash ^= hash_diff
+        self.mirror_hash ^= mirror_diff
         self.player ^= 3
-        
+
+    def can_reach_last_row(self):
+        """ Whether the player to move has a piece one quiet step away from winning """
+        if self.player == 1:
+            return bool((self.white_pieces & PRE_PROMOTION_ROW[1]) << BOARD_SIZE & self.empty_squares)
+        return bool((self.black_pieces & PRE_PROMOTION_ROW[2]) >> BOARD_SIZE & self.empty_squares)
+
     def check_winner(self):
-        if self.white_pieces & 0x1FF000000:
+        if self.white_pieces & PROMOTION_ROW[1]:
             return 1
-        if self.black_pieces & 0x1FF:
+        if self.black_pieces & PROMOTION_ROW[2]:
             return 2
         return 0
-    def move(self, player, movefrom, moveto):
-        bit_pos_from = self.get_bitboard_position(*movefrom)
-        bit_pos_to = self.get_bitboard_position(*moveto)
-
-        # Calculate initial state of bitboards before the move
-        white_initial = self.white_pieces
-        black_initial = self.black_pieces
-        empty_initial = self.empty_squares
-
-        # Perform the move (same as before)
-        shift = bit_pos_from | bit_pos_to
-
-        if (y0 := movefrom[0], x0 := movefrom[1], y1 := moveto[0], x1 := moveto[1]) in self.legal_moves:
-            mid_y, mid_x = (y0 + y1) // 2, (x0 + x1) // 2
-            if abs(y1 - y0) == 2:
-                mid_pos = self.get_bitboard_position(mid_y, mid_x)
-
-                if player == 1:
-                    self.black_pieces ^= mid_pos  # Remove black piece
-                else:
-                    self.white_pieces ^= mid_pos  # Remove white piece
-
-                self.empty_squares ^= mid_pos  # Update empty squares
-
-            # Move the piece and update empty squares
-            if player == 1:
-                self.white_pieces ^= shift  # Move white piece
-            else:
-                self.black_pieces ^= shift  # Move black piece
-            self.empty_squares ^= shift  # Update empty squares
-
-            # Save the difference between the initial and final states of the bitboards
-            white_diff = self.white_pieces ^ white_initial
-            black_diff = self.black_pieces ^ black_initial
-            empty_diff = self.empty_squares ^ empty_initial
 
-            # Append the shifts to history for undo
-            self.previous.append((white_diff, black_diff, empty_diff))
+    def move(self, player, movefrom, moveto):
+        """ Play movefrom -> moveto for player if it is a legal move
+
+            Returns the encoded move that was played, or 0 if the move was not legal.
+        """
+        if player == self.player and (y0 := movefrom[0], x0 := movefrom[1], y1 := moveto[0], x1 := moveto[1]) in self.legal_moves:
+            move = encode_move(y0, x0, y1, x1)
+            # Keep the legal moves of this position for undo(), the next position builds its own on first use
+            self.legal_snapshots.append((self.legal_key, self.legal_cache))
+            self.make_move(move)
+            return move
+        return 0
 
-            # Switch player
-            self.player ^= 3
-            
-            # Update legal moves
-            self.legalmoves()
+    def iter_pieces(self, player):
+        """ Yield the (y, x) squares of the player's pieces, one bit at a time """
+        bitboard = self.white_pieces if player == 1 else self.black_pieces
+        while bitboard:
+            bit = bitboard & -bitboard
+            bitboard ^= bit
+            yield SQUARE_COORDS[bit.bit_length() - 1]
 
     def get_piece_positions(self, player):
         bitboard = self.white_pieces if player == 1 else self.black_pieces
-        positions = set()
-        for bit in range(BOARD_SIZE ** 2):
-            if bitboard & (1 << bit):
-                y, x = divmod(bit, BOARD_SIZE)
-                positions.add((y, x))
-        return positions
+        return {SQUARE_COORDS[square] for square in range(SQUARES) if bitboard & SQUARE_BIT[square]}
 
     def count_pieces(self, player):
         if player == 1:
@@ -219,14 +327,42 @@ class Chessboard:
             print()
         print()
 
-    def compute_zobrist_hash(self):
+    def compute_zobrist_hash(self, white_pieces=None, black_pieces=None):
+        """ Compute the hash from scratch; move/undo keep self.zobrist_hash up to date incrementally
+
+            Other bitboards can be hashed with the player to move of this board, e.g. the mirror image.
+        """
+        white_pieces = self.white_pieces if white_pieces is None else white_pieces
+        black_pieces = self.black_pieces if black_pieces is None else black_pieces
         hash_value = 0
-        # XOR the hash values for white and black pieces
-        if self.white_pieces:
-            hash_value ^= self.table['white']
-        if self.black_pieces:
-            hash_value ^= self.table['black']
+        # XOR the per-square hash values for white and black pieces
+        for color, bitboard in (('white', white_pieces), ('black', black_pieces)):
+            keys = self.table[color]
+            while bitboard:
+                bit = bitboard & -bitboard
+                bitboard ^= bit
+                hash_value ^= keys[bit.bit_length() - 1]
         # XOR the hash value for the current player
         hash_value ^= self.table['player'][self.player - 1]
         return hash_value
 
+    def compute_mirror_hash(self):
+        """ Hash of the position mirrored in the middle file, kept up to date in self.mirror_hash """
+        return self.compute_zobrist_hash(mirror_bitboard(self.white_pieces), mirror_bitboard(self.black_pieces))
+
+    def canonical_hash(self):
+        """ Hash shared by the position and its mirror image, with whether it is the mirror's hash
+
+            Mirrored positions play the same, so a table keyed on this hash stores each pair
+            once; moves stored under a mirrored key have to be mirrored too (moves.mirror_move).
+        """
+        if self.mirror_hash < self.zobrist_hash:
+            return self.mirror_hash, True
+        return self.zobrist_hash, False
+
+def game_winner(chessboard):
+    """ Winning player from the board state, 0 while the game goes on """
+    winner = chessboard.check_winner()
+    if not winner and not chessboard.legal_moves:
+        winner = chessboard.player ^ 3  # A player that cannot move loses
+    return winner
@@ -0,0 +1,277 @@
+"""
+    Headless engine speaking a line-based text protocol on stdin/stdout
+
+    Commands, one per line, act on the current session; sessions are independent games
+    sharing the process and its transposition table:
+        session <name>                 select a session, created at the start position if new
+        sessions                       list the sessions
+        close [<name>]                 delete a session, the current one by default
+        new                            reset the current session to the start position
+        position start|<white> <black> <player> [moves <move>...]
+                                       set the position, bitboards as decimal integers
+        moves <move>...                play moves, e.g. 'e1e2' (file letter, row number)
+        undo [<plies>]                 take back moves
+        show                           position <white> <black> <player> ply <n> winner <player or 0>
+        legal                          legal <move>...
+        go [time <seconds>] [depth <plies>] [nodes <n>] [mode search|mcts|random|parallel]
+                                       search the position: info lines, then bestmove <move> or bestmove none.
+                                       Limits not given are unlimited if any is given, else the defaults.
+                                       Mode mcts takes no depth.
+        isready                        readyok, once every earlier command is done
+        quit
+    Malformed or illegal commands answer error <message>; the session is left unchanged.
+"""
+import argparse
+import sys
+import time
+from chessboard import Chessboard, game_winner
+from fiancoai import FiancoAI
+from moves import move_text, parse_move
+from parameters import AI_MAX_DEPTH, AI_NODE_LIMIT, AI_TIME_LIMIT, MAX_PIECES, MAX_PLY
+from searchstats import SearchStats
+from tables import FULL_BOARD
+import transpositiontable
+
+DEFAULT_SESSION = 'default'
+MODES = ('search', 'mcts', 'random', 'parallel')
+
+class ProtocolError(Exception):
+    """ A command that cannot be carried out, reported as an error line """
+
+class InfoStats(SearchStats):
+    """ SearchStats that reports every finished iteration as an info line """
+    def __init__(self, server, ai):
+        super().__init__()
+        self.server = server
+        self.ai = ai
+
+    def end_iteration(self, depth, nodes):
+        super().end_iteration(depth, nodes)
+        self.server.info(depth, self.ai.best_score, nodes, time.perf_counter() - self.start_time)
+
+class Session:
+    """
+        One independent game
+
+        Attributes:
+        - board: Current position and the moves played from the last position command
+        - ai: FiancoAI searching the board for the player to move
+    """
+    def __init__(self, server):
+        self.board = Chessboard()
+        self.ai = FiancoAI(self.board, self.board.player)
+        self.ai.stats = InfoStats(server, self.ai)
+
+    def play(self, texts):
+        """ Play moves in text form, all or none of them """
+        played = 0
+        try:
+            for text in texts:
+                if game_winner(self.board):
+                    raise ProtocolError(f"game is over, cannot play {text}")
+                try:
+                    move = parse_move(text)
+                except ValueError as error:
+                    raise ProtocolError(str(error))
+                if not self.board.move(self.board.player, move[:2], move[2:]):
+                    raise ProtocolError(f"illegal move {text}")
+                played += 1
+        except ProtocolError:
+            for _ in range(played):
+                self.board.undo()
+            raise
+
+    def set_position(self, position, texts):
+        """ Start from (white pieces, black pieces, player) and play moves in text form, or keep the old board """
+        previous, self.board = self.board, Chessboard.from_bitboards(*position)
+        try:
+            self.play(texts)
+        except ProtocolError:
+            self.board = previous
+            raise
+
+    def close(self):
+        if self.ai.parallel is not None:
+            self.ai.parallel.close()
+
+class EngineServer:
+    """
+        Reads commands, keeps the sessions and writes the replies
+
+        Attributes:
+        - sessions: Sessions by name
+        - current: Name of the session commands act on
+        - output: Text stream the replies are written to
+    """
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.sessions = {}
+        self.current = DEFAULT_SESSION
+        self.commands = {
+            'session': self.select_session,
+            'sessions': self.list_sessions,
+            'close': self.close_session,
+            'new': self.new_game,
+            'position': self.position,
+            'moves': self.moves,
+            'undo': self.undo,
+            'show': self.show,
+            'legal': self.legal,
+            'go': self.go,
+            'isready': self.isready,
+        }
+
+    def reply(self, line):
+        self.output.write(line + '\n')
+        self.output.flush()
+
+    def info(self, depth, score, nodes, seconds):
+        self.reply(f"info depth {depth} score {score} nodes {nodes} time {round(seconds * 1000)}")
+
+    @property
+    def session(self):
+        if self.current not in self.sessions:
+            self.sessions[self.current] = Session(self)
+        return self.sessions[self.current]
+
+    def run(self, lines):
+        """ Handle lines until quit or the end of the input """
+        for line in lines:
+            if not self.handle(line):
+                break
+        for session in self.sessions.values():
+            session.close()
+
+    def handle(self, line):
+        """ Carry out one command line, returns False on quit """
+        words = line.split()
+        if not words:
+            return True
+        if words[0] == 'quit':
+            return False
+        command = self.commands.get(words[0])
+        try:
+            if command is None:
+                raise ProtocolError(f"unknown command {words[0]}")
+            command(words[1:])
+        except ProtocolError as error:
+            self.reply(f"error {error}")
+        return True
+
+    def select_session(self, args):
+        if len(args) != 1:
+            raise ProtocolError("usage: session <name>")
+        self.current = args[0]
+        self.session
+
+    def list_sessions(self, args):
+        self.reply(' '.join(['sessions', *self.sessions]))
+
+    def close_session(self, args):
+        name = args[0] if args else self.current
+        if name not in self.sessions:
+            raise ProtocolError(f"no session {name}")
+        self.sessions.pop(name).close()
+
+    def new_game(self, args):
+        if self.current in self.sessions:
+            self.sessions.pop(self.current).close()
+        self.session
+
+    def position(self, args):
+        if 'moves' in args:
+            split = args.index('moves')
+            args, moves = args[:split], args[split + 1:]
+        else:
+            moves = []
+        if args == ['start']:
+            start = Chessboard()
+            position = start.white_pieces, start.black_pieces, start.player
+        elif len(args) == 3:
+            try:
+                position = tuple(map(int, args))
+            except ValueError:
+                raise ProtocolError("bitboards and player must be integers")
+            white_pieces, black_pieces, player = position
+            if player not in (1, 2) or min(white_pieces, black_pieces) < 0 or white_pieces & black_pieces or (white_pieces | black_pieces) & ~FULL_BOARD:
+                raise ProtocolError("not a valid position")
+            if max(white_pieces.bit_count(), black_pieces.bit_count()) > MAX_PIECES:
+                raise ProtocolError(f"more than {MAX_PIECES} pieces per side")
+        else:
+            raise ProtocolError("usage: position start|<white> <black> <player> [moves <move>...]")
+        self.session.set_position(position, moves)
+
+    def moves(self, args):
+        self.session.play(args)
+
+    def undo(self, args):
+        try:
+            plies = int(args[0]) if args else 1
+        except ValueError:
+            raise ProtocolError("usage: undo [<plies>]")
+        board = self.session.board
+        if not 0 <= plies <= len(board.history):
+            raise ProtocolError(f"only {len(board.history)} moves to take back")
+        for _ in range(plies):
+            board.undo()
+
+    def show(self, args):
+        board = self.session.board
+        self.reply(f"position {board.white_pieces} {board.black_pieces} {board.player} ply {len(board.history)} winner {game_winner(board)}")
+
+    def legal(self, args):
+        board = self.session.board
+        moves = [] if board.check_winner() else sorted(board.legal_moves)
+        self.reply(' '.join(['legal', *(move_text(*move) for move in moves)]))
+
+    def go(self, args):
+        if len(args) % 2:
+            raise ProtocolError("usage: go [time <seconds>] [depth <plies>] [nodes <n>] [mode <mode>]")
+        options = dict(zip(args[::2], args[1::2]))
+        unknown = set(options) - {'time', 'depth', 'nodes', 'mode'}
+        if unknown:
+            raise ProtocolError(f"unknown go option {sorted(unknown)[0]}")
+        limited = bool(set(options) & {'time', 'depth', 'nodes'})
+        try:
+            time_limit = float(options['time']) if 'time' in options else float('inf') if limited else AI_TIME_LIMIT
+            max_depth = int(options['depth']) if 'depth' in options else MAX_PLY // 2 if limited else AI_MAX_DEPTH
+            node_limit = int(options['nodes']) if 'nodes' in options else float('inf') if limited else AI_NODE_LIMIT
+        except ValueError:
+            raise ProtocolError("time, depth and nodes must be numbers")
+        mode = options.get('mode', 'search')
+        if mode not in MODES:
+            raise ProtocolError(f"unknown mode {mode}")
+        if mode == 'mcts' and 'depth' in options:
+            raise ProtocolError("mode mcts has no depth, limit it by time or nodes")
+        if not 1 <= max_depth <= MAX_PLY // 2:
+            raise ProtocolError(f"depth must be between 1 and {MAX_PLY // 2}")
+
+        session = self.session
+        board, ai = session.board, session.ai
+        if game_winner(board):
+            self.reply("bestmove none")
+            return
+        ai.chessboard, ai.color, ai.mode = board, board.player, mode
+        ai.time_limit, ai.max_depth, ai.node_limit = time_limit, max_depth, node_limit
+        ai.stopped = False
+        ai.stats.reset()
+        start = time.perf_counter()
+        move = ai.get_move()
+        if not ai.stats.iterations and mode != 'random':
+            # Modes without iterative deepening report once at the end
+            self.info(ai.completed_depth, ai.best_score, ai.nodes, time.perf_counter() - start)
+        self.reply(f"bestmove {move_text(*move) if move else 'none'}")
+
+    def isready(self, args):
+        self.reply("readyok")
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless Fianco engine with a line-based protocol on stdin/stdout")
+    parser.add_argument('--tt-mb', type=int, default=None, help="transposition table size shared by the sessions")
+    args = parser.parse_args()
+    if args.tt_mb:
+        transpositiontable.init_table(args.tt_mb)
+    EngineServer().run(sys.stdin)
+
+if __name__ == "__main__":
+    main()
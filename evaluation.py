@@ -0,0 +1,70 @@
+"""
+    Static evaluation from bitboards
+
+    The score is linear in a few features, each the white count minus the black count:
+    - material: pieces on the board
+    - advancement: rows every piece has advanced from its own first row
+    - runners: pieces no enemy piece can reach before they arrive on the last row
+
+    Everything is computed with whole-board shifts and popcounts.
+"""
+from parameters import BOARD_SIZE, EVAL_WEIGHTS
+from tables import FULL_BOARD, NOT_FIRST_FILE, NOT_LAST_FILE, ROW_MASKS
+
+FEATURES = ('material', 'advancement', 'runners')
+
+# Row bit planes: plane k holds the rows whose advancement has bit k set, so the summed
+# advancement of a bitboard is sum(popcount(pieces & plane) << k)
+ADVANCEMENT_PLANES = [0, [], []]
+for bit in range((BOARD_SIZE - 1).bit_length()):
+    ADVANCEMENT_PLANES[1].append(sum(ROW_MASKS[row] for row in range(BOARD_SIZE) if row >> bit & 1))
+    ADVANCEMENT_PLANES[2].append(sum(ROW_MASKS[BOARD_SIZE - 1 - row] for row in range(BOARD_SIZE) if row >> bit & 1))
+
+def weight_vector(weights=None):
+    """ Weights in FEATURES order from a dict (missing features weigh 0) or a sequence """
+    weights = EVAL_WEIGHTS if weights is None else weights
+    if isinstance(weights, dict):
+        return tuple(weights.get(name, 0) for name in FEATURES)
+    return tuple(weights)
+
+DEFAULT_WEIGHTS = weight_vector()
+
+def advancement(pieces, player):
+    total = 0
+    for bit, plane in enumerate(ADVANCEMENT_PLANES[player]):
+        total += (pieces & plane).bit_count() << bit
+    return total
+
+def spread(bitboard):
+    """ The bitboard together with its left and right neighbours """
+    return bitboard | (bitboard << 1 & NOT_FIRST_FILE) | (bitboard >> 1 & NOT_LAST_FILE)
+
+def white_runners(white_pieces, black_pieces):
+    """ White pieces outside the cone of every black piece: a black piece k rows further down reaches k files to each side """
+    runners, front = white_pieces, black_pieces
+    while front and runners:
+        front = spread(front >> BOARD_SIZE)
+        runners &= ~front
+    return runners
+
+def black_runners(white_pieces, black_pieces):
+    runners, front = black_pieces, white_pieces
+    while front and runners:
+        front = spread(front << BOARD_SIZE) & FULL_BOARD
+        runners &= ~front
+    return runners
+
+def features(white_pieces, black_pieces):
+    """ Feature values in FEATURES order, white minus black """
+    return (
+        white_pieces.bit_count() - black_pieces.bit_count(),
+        advancement(white_pieces, 1) - advancement(black_pieces, 2),
+        white_runners(white_pieces, black_pieces).bit_count() - black_runners(white_pieces, black_pieces).bit_count(),
+    )
+
+def evaluate(white_pieces, black_pieces, player, weights=DEFAULT_WEIGHTS):
+    """ Score of the position from the point of view of player, weights in FEATURES order (see weight_vector) """
+    material_weight, advancement_weight, runner_weight = weights
+    material, advanced, runners = features(white_pieces, black_pieces)
+    score = material_weight * material + advancement_weight * advanced + runner_weight * runners
+    return score if player == 1 else -score
@@ -1,24 +1,302 @@
 from chessboard import Chessboard
+from moves import *
+from parameters import *
 import random
+import time
+import transpositiontable
+import evaluation
+from tablebase import default_tablebase
+
+class SearchTimeout(Exception):
+    """ Raised inside the search when the time or node budget is exhausted """
 
 class FiancoAI:
-    def __init__(self, chessboard, color):
+    """
+        Fianco engine playing one color on a shared chessboard
+
+        Attributes:
+        - chessboard: Board the AI plays on, searched in place with make_move/undo_no_check
+        - color: Player number of the AI (1 for white, 2 for black)
+        - mode: 'search' for iterative-deepening alpha-beta, 'parallel' for Lazy SMP over several processes,
+          'mcts' for Monte Carlo tree search with batched playouts, 'random' for random moves
+        - time_limit: Wall-clock budget per move in seconds
+        - node_limit: Maximum number of nodes searched per move
+        - max_depth: Maximum iterative-deepening depth
+        - table: Transposition table module with probe/store, or None
+        - start_depth: First iterative-deepening depth, staggered between Lazy SMP workers
+        - root_seed: Seed the root moves are shuffled with, varied between Lazy SMP workers; None keeps them sorted
+        - workers: Number of search processes in 'parallel' mode, all cores by default
+        - stopped: Set from another thread by stop() to end the current search early
+        - stats: SearchStats collecting counters of every search, or None
+        - weights: Evaluation weights as a dict by feature name or a sequence in evaluation.FEATURES order
+        - tablebase: Endgame Tablebase probed by the search, loaded from TABLEBASE_FILE if use_tablebase is set and the file exists
+        - table_salt: Stable hash of the weights XORed into every table key, so engines with other weights never use each other's scores
+    """
+    def __init__(self, chessboard, color, mode='search', time_limit=AI_TIME_LIMIT, node_limit=AI_NODE_LIMIT, max_depth=AI_MAX_DEPTH, table=transpositiontable, start_depth=1, root_seed=None, workers=None, stats=None, weights=None, use_tablebase=True):
         self.chessboard = chessboard
         self.color = color
-    
+        self.mode = mode
+        self.time_limit = time_limit
+        self.node_limit = node_limit
+        self.max_depth = max_depth
+        self.table = table
+        self.start_depth = start_depth
+        self.root_seed = root_seed
+        self.workers = workers
+        self.parallel = None
+        self.monte_carlo = None
+        self.move_lists = new_move_lists()
+        self.nodes = self.qnodes = 0
+        self.ply = 0
+        self.deadline = 0.0
+        self.completed_depth = 0
+        self.best_score = 0
+        self.stopped = False
+        self.stats = stats
+        self.weights = evaluation.weight_vector(weights)
+        self.table_salt = random.Random(repr(self.weights)).getrandbits(64)
+        self.tablebase = default_tablebase() if use_tablebase else None
+
     def get_move(self):
-        return self.random_move()[0], self.random_move()[1]
-        
+        """ Return the chosen move as (y0, x0, y1, x1), or None if there is no legal move """
+        if self.mode == 'random':
+            move = self.random_move()
+            return move and (*move[0], *move[1])
+        if self.mode == 'parallel':
+            if self.parallel is None:
+                from lazysmp import ParallelSearch
+                self.parallel = ParallelSearch(self.workers)
+            self.parallel.reset()
+            if self.stopped:
+                self.parallel.stop()  # stop() came before the reset
+            move = self.parallel.search(self.chessboard, self.table is not None, time_limit=self.time_limit, node_limit=self.node_limit,
+                                        max_depth=self.max_depth, weights=self.weights, use_tablebase=self.tablebase is not None)
+            self.completed_depth, self.best_score, self.nodes = self.parallel.completed_depth, self.parallel.best_score, self.parallel.nodes
+            return move
+        if self.mode == 'mcts':
+            if self.monte_carlo is None:
+                from mcts import MonteCarloSearch
+                self.monte_carlo = MonteCarloSearch()
+            return self.monte_carlo.search(self)
+        return self.search()
+
+    def stop(self):
+        """ Ask a search running in another thread to return its best move so far """
+        self.stopped = True
+        if self.parallel is not None:
+            self.parallel.stop()
+
     def random_move(self):
-        # Ensure that legalmoves() returns a list of moves
-        moves = self.chessboard.legalmoves()  
+        moves = list(self.chessboard.legal_moves)
         if moves:
             # Pick a random move
             move = random.choice(moves)
-            # Convert move to a format with start and end positions agitis lists
+            # Convert move to a format with start and end positions
             move_from = (move[0], move[1])
             move_to = (move[2], move[3])
             return move_from, move_to
         else:
             # Return None if no moves are available
             return None
+
+    def evaluate(self):
+        """ Static evaluation from the point of view of the player to move """
+        board = self.chessboard
+        return evaluation.evaluate(board.white_pieces, board.black_pieces, board.player, self.weights)
+
+    def search(self, new_search=True):
+        """ Iterative-deepening negamax, returns the best move of the deepest finished iteration
+
+            new_search is False for Lazy SMP workers, whose parent ages the shared table once per move.
+        """
+        board = self.chessboard
+        moves = self.move_lists[0]
+        count = board.generate_moves(moves)
+        if not count:
+            return None
+        root_moves = sorted(moves[:count])
+        if self.root_seed is not None:
+            random.Random(self.root_seed).shuffle(root_moves)
+
+        self.nodes = self.qnodes = 0
+        self.ply = 0
+        self.completed_depth = 0
+        self.deadline = time.perf_counter() + self.time_limit
+        best_move = root_moves[0]
+        if self.table and new_search:
+            self.table.new_search()
+        stats = self.stats
+        if stats:
+            stats.reset()
+            if self.table:
+                self.table.attach_stats(stats)
+
+        try:
+            for depth in range(self.start_depth, self.max_depth + 1):
+                if stats:
+                    stats.start_iteration()
+                # Search the previous best move first so a partial iteration is still usable
+                root_moves.remove(best_move)
+                root_moves.insert(0, best_move)
+                alpha = -INFINITY
+                for move in root_moves:
+                    score = self.search_move(move, depth, alpha, INFINITY)
+                    if score > alpha:
+                        alpha, best_move = score, move
+                self.completed_depth, self.best_score = depth, alpha
+                if stats:
+                    stats.end_iteration(depth, self.nodes)
+                if alpha >= WIN_SCORE - depth or alpha <= -WIN_SCORE + depth:
+                    break  # Forced result found, deeper iterations will not change it
+        except SearchTimeout:
+            # Unwind the moves made by the interrupted iteration
+            while self.ply:
+                board.undo_no_check()
+                self.ply -= 1
+
+        if stats:
+            if self.table:
+                self.table.attach_stats(None)
+            stats.nodes, stats.qnodes = self.nodes, self.qnodes
+            stats.finish(player=board.player, depth=self.completed_depth, score=self.best_score, move=decode_move(best_move))
+        return decode_move(best_move)
+
+    def search_move(self, move, depth, alpha, beta):
+        """ Make a move, score it from the mover's point of view and take it back """
+        board = self.chessboard
+        last_row = BOARD_SIZE - 1 if board.player == 1 else 0
+        board.make_move(move)
+        self.ply += 1
+        if (move >> TO_SHIFT & SQUARE_MASK) // BOARD_SIZE == last_row:
+            score = WIN_SCORE - self.ply  # The moved piece reached the last row
+        else:
+            score = -self.negamax(depth - 1, -beta, -alpha)
+        board.undo_no_check()
+        self.ply -= 1
+        return score
+
+    def negamax(self, depth, alpha, beta):
+        if depth <= 0:
+            return self.quiescence(alpha, beta)
+        self.nodes += 1
+        if not self.nodes & 1023 and (self.stopped or time.perf_counter() > self.deadline or self.nodes >= self.node_limit):
+            raise SearchTimeout
+
+        board = self.chessboard
+        if self.tablebase:
+            score = self.probe_tablebase()
+            if score is not None:
+                return score
+        moves = self.move_lists[self.ply]
+        count = board.generate_moves(moves)
+        if not count:
+            return -WIN_SCORE + self.ply  # A player that cannot move loses
+
+        table = self.table
+        if table:
+            # Mirrored positions share one entry, its move is stored as played in the position of the key
+            key, mirrored = board.canonical_hash()
+            key ^= self.table_salt
+            entry = table.probe(key)
+            if entry:
+                table_move, flag, score, entry_depth = entry
+                if mirrored:
+                    table_move = mirror_move(table_move)
+                if entry_depth >= depth:
+                    score = self.score_from_table(score)
+                    if flag == table.FLAG_EXACT or (flag == table.FLAG_LOWER and score >= beta) or (flag == table.FLAG_UPPER and score <= alpha):
+                        return score
+                # Search the stored best move first
+                try:
+                    index = moves.index(table_move, 0, count)
+                    moves[0], moves[index] = table_move, moves[0]
+                except ValueError:
+                    if self.stats:
+                        self.stats.tt_collisions += 1  # The entry belongs to another position with the same key
+
+        alpha_initial = alpha
+        best, best_move = -INFINITY, moves[0]
+        for i in range(count):
+            move = moves[i]
+            score = self.search_move(move, depth, alpha, beta)
+            if score > best:
+                best, best_move = score, move
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if self.stats:
+                            self.stats.beta_cutoffs += 1
+                            self.stats.first_move_cutoffs += i == 0
+                        break
+
+        if table:
+            flag = table.FLAG_UPPER if best <= alpha_initial else table.FLAG_LOWER if best >= beta else table.FLAG_EXACT
+            table.store(key, mirror_move(best_move) if mirrored else best_move, flag, self.score_to_table(best), depth)
+        return best
+
+    def quiescence(self, alpha, beta):
+        """ Resolve pending captures past the nominal depth before evaluating
+
+            Captures are mandatory, so only a position without captures for the player to move
+            is quiet enough to stand pat on. With captures pending all of them are searched: a
+            capture can land on the last row, and one capture can force a chain of replies, so
+            no material margin bounds what the sequence wins and there is no delta pruning.
+        """
+        self.nodes += 1
+        self.qnodes += 1
+        if not self.nodes & 1023 and (self.stopped or time.perf_counter() > self.deadline or self.nodes >= self.node_limit):
+            raise SearchTimeout
+
+        board = self.chessboard
+        if self.tablebase:
+            score = self.probe_tablebase()
+            if score is not None:
+                return score
+        moves = self.move_lists[self.ply]
+        count = board.generate_captures(moves)
+        if not count:
+            # Stand pat, after checking for the two quiet moves the evaluation cannot see
+            if not board.has_quiet_moves():
+                return -WIN_SCORE + self.ply  # A player that cannot move loses
+            if board.can_reach_last_row():
+                return WIN_SCORE - self.ply - 1
+            return self.evaluate()
+
+        if self.ply >= MAX_PLY - 1:
+            return self.evaluate()  # Out of move buffers
+
+        best = -INFINITY
+        for i in range(count):
+            score = self.search_move(moves[i], 0, alpha, beta)
+            if score > best:
+                best = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        if self.stats:
+                            self.stats.beta_cutoffs += 1
+                            self.stats.first_move_cutoffs += i == 0
+                        break
+        return best
+
+    def probe_tablebase(self):
+        """ Exact score of an endgame position from the tablebase, None if it is not covered """
+        board = self.chessboard
+        if (board.white_pieces | board.black_pieces).bit_count() > self.tablebase.max_total:
+            return None
+        return self.tablebase.probe_score(board.white_pieces, board.black_pieces, board.player, self.ply)
+
+    def score_to_table(self, score):
+        """ Store win/loss scores relative to the current node rather than the root """
+        if score >= WIN_THRESHOLD:
+            return score + self.ply
+        if score <= -WIN_THRESHOLD:
+            return score - self.ply
+        return score
+
+    def score_from_table(self, score):
+        if score >= WIN_THRESHOLD:
+            return score - self.ply
+        if score <= -WIN_THRESHOLD:
+            return score + self.ply
+        return score
@@ -0,0 +1,111 @@
+"""
+    Compact binary game records
+
+    A record file starts with FILE_HEADER (magic, format version, board size) and then holds
+    games back to back, appended as they finish. Each game is GAME_HEADER (result, flags,
+    number of moves), the start position if FLAG_START_POSITION is set, and one 16-bit
+    little-endian encoded move per ply (see moves.py).
+"""
+import struct
+import sys
+from array import array
+from collections import namedtuple
+from chessboard import Chessboard
+from parameters import BOARD_SIZE
+
+MAGIC = b'FIANCOGR'
+VERSION = 1
+FILE_HEADER = struct.Struct('<8sHB5x')
+GAME_HEADER = struct.Struct('<BBH')
+
+# Game header flags
+FLAG_START_POSITION = 1
+
+# Results: the winning player, or RESULT_NONE for a draw or an unfinished game
+RESULT_NONE = 0
+
+BITBOARD_BYTES = (BOARD_SIZE * BOARD_SIZE + 7) // 8
+POSITION_SIZE = 2 * BITBOARD_BYTES + 1
+
+GameRecord = namedtuple('GameRecord', ['result', 'moves', 'start'])
+
+def pack_position(white_pieces, black_pieces, player):
+    return white_pieces.to_bytes(BITBOARD_BYTES, 'little') + black_pieces.to_bytes(BITBOARD_BYTES, 'little') + bytes([player])
+
+def unpack_position(data):
+    return (int.from_bytes(data[:BITBOARD_BYTES], 'little'),
+            int.from_bytes(data[BITBOARD_BYTES:2 * BITBOARD_BYTES], 'little'),
+            data[2 * BITBOARD_BYTES])
+
+class GameRecordWriter:
+    """
+        Append-only writer of game records
+
+        Every write_game appends one complete record and flushes it, so the file only ever
+        holds whole games. A finished board is written with write_board.
+
+        Attributes:
+        - path: Record file, created with its header on first use
+    """
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(FILE_HEADER.pack(MAGIC, VERSION, BOARD_SIZE))
+            self.file.flush()
+
+    def write_game(self, moves, result, start=None):
+        """ Append one game: its encoded moves, the winner (RESULT_NONE if none) and an optional start position """
+        moves = array('H', moves)
+        self.file.write(GAME_HEADER.pack(result, FLAG_START_POSITION if start else 0, len(moves)))
+        if start:
+            self.file.write(pack_position(*start))
+        if sys.byteorder != 'little':
+            moves.byteswap()
+        self.file.write(moves.tobytes())
+        self.file.flush()
+
+    def write_board(self, board, result):
+        """ Append the moves played on a board since the initial position, if there are any """
+        if board.history:
+            self.write_game(board.history.moves_played(), result)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def read_games(path):
+    """ Yield GameRecord(result, moves, start) for every game in a record file, one game in memory at a time """
+    with open(path, 'rb') as file:
+        magic, version, board_size = FILE_HEADER.unpack(file.read(FILE_HEADER.size))
+        if magic != MAGIC or version != VERSION or board_size != BOARD_SIZE:
+            raise ValueError(f"{path} is not a version {VERSION} game record file for a {BOARD_SIZE}x{BOARD_SIZE} board")
+        while True:
+            header = file.read(GAME_HEADER.size)
+            if len(header) < GAME_HEADER.size:
+                return  # End of file, or a game cut short by an interrupted write
+            result, flags, count = GAME_HEADER.unpack(header)
+            start = unpack_position(file.read(POSITION_SIZE)) if flags & FLAG_START_POSITION else None
+            data = file.read(2 * count)
+            if len(data) < 2 * count:
+                return
+            moves = array('H')
+            moves.frombytes(data)
+            if sys.byteorder != 'little':
+                moves.byteswap()
+            yield GameRecord(result, moves, start)
+
+def replay(record):
+    """ Yield (board, move) for every move of a record, with the board in the position before the move
+
+        The same board is reused and updated in place, copy what needs to outlive the iteration.
+    """
+    board = Chessboard.from_bitboards(*record.start) if record.start else Chessboard()
+    for move in record.moves:
+        yield board, move
+        board.make_move(move)
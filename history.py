@@ -0,0 +1,71 @@
+from array import array
+from parameters import HISTORY_CAPACITY
+
+NO_CAPTURE = -1
+
+class MoveHistory:
+    """
+        Growable stack of the moves played on a board, one entry per ply
+
+        The fields live in parallel preallocated arrays that double in size when full, so
+        push and pop never allocate in the steady state and undo never runs out.
+
+        Attributes:
+        - moves: Encoded move of every ply (see moves.py)
+        - captured: Square of the piece the move captured, NO_CAPTURE for a quiet move
+        - hashes: Zobrist hash of the position before the move
+        - mirror_hashes: Zobrist hash of the mirror image of that position
+        - length: Number of plies on the stack, entries past it are stale
+    """
+    def __init__(self, capacity=HISTORY_CAPACITY):
+        self.moves = array('H', [0]) * capacity
+        self.captured = array('b', [NO_CAPTURE]) * capacity
+        self.hashes = array('Q', [0]) * capacity
+        self.mirror_hashes = array('Q', [0]) * capacity
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        """ (move, captured square, hash and mirror hash before the move) of a ply, negative indices count from the top """
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("history index out of range")
+        return self.moves[index], self.captured[index], self.hashes[index], self.mirror_hashes[index]
+
+    def push(self, move, captured, zobrist_hash, mirror_hash):
+        index = self.length
+        if index == len(self.moves):
+            self.grow()
+        self.moves[index] = move
+        self.captured[index] = captured
+        self.hashes[index] = zobrist_hash
+        self.mirror_hashes[index] = mirror_hash
+        self.length = index + 1
+
+    def pop(self):
+        """ Remove the top ply and return (move, captured square, hash and mirror hash before the move) """
+        index = self.length - 1
+        if index < 0:
+            raise IndexError("pop from empty history")
+        self.length = index
+        return self.moves[index], self.captured[index], self.hashes[index], self.mirror_hashes[index]
+
+    def grow(self):
+        self.moves.extend(self.moves)
+        self.captured.extend(self.captured)
+        self.hashes.extend(self.hashes)
+        self.mirror_hashes.extend(self.mirror_hashes)
+
+    def clear(self):
+        self.length = 0
+
+    def count_position(self, zobrist_hash):
+        """ Number of earlier positions with this hash, for repetition checks """
+        return self.hashes[:self.length].count(zobrist_hash)
+
+    def moves_played(self):
+        """ Copy of the encoded moves from the first ply on, e.g. for a game record """
+        return self.moves[:self.length]
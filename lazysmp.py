@@ -0,0 +1,93 @@
+import multiprocessing
+import os
+from chessboard import Chessboard
+from fiancoai import FiancoAI
+import transpositiontable
+
+# Start depths the workers cycle through, the root move order differs for every worker
+START_DEPTHS = (1, 2, 3)
+
+# Set in every worker by init_worker: the shared stop flag of the pool
+stop_flag = None
+
+class StopFlag:
+    """ Boolean in shared memory, set by the parent process and read by the forked workers """
+    def __init__(self, context):
+        self.value = context.RawValue('b', 0)
+
+    def __bool__(self):
+        return bool(self.value.value)
+
+    def set(self):
+        self.value.value = 1
+
+    def clear(self):
+        self.value.value = 0
+
+def init_worker(flag):
+    global stop_flag
+    stop_flag = flag
+
+def search_worker(task):
+    """ Search the root position in a worker process, returns (completed depth, score, move, nodes) """
+    white_pieces, black_pieces, player, start_depth, root_seed, use_table, config = task
+    board = Chessboard.from_bitboards(white_pieces, black_pieces, player)
+    ai = FiancoAI(board, player, start_depth=start_depth, root_seed=root_seed, table=transpositiontable if use_table else None, **config)
+    ai.stopped = stop_flag
+    move = ai.search(new_search=False)
+    return ai.completed_depth, ai.best_score, move, ai.nodes
+
+class ParallelSearch:
+    """
+        Lazy SMP: several processes search the same root and share the transposition table
+
+        The worker pool is forked after the table is allocated, so every worker maps the same
+        table memory (an anonymous shared mapping in both backends). Workers differ in their
+        first iterative-deepening depth and in the order of the root moves; what one worker
+        stores in the table speeds up the others. The result of the deepest finished iteration
+        is played.
+
+        Attributes:
+        - workers: Number of worker processes
+        - stop_flag: StopFlag shared with the workers, set by stop() to end the running search
+        - completed_depth, best_score, nodes: Statistics of the last search
+    """
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count()
+        self.context = multiprocessing.get_context('fork')
+        self.stop_flag = StopFlag(self.context)
+        self.pool = None
+        self.completed_depth = 0
+        self.best_score = 0
+        self.nodes = 0
+
+    def search(self, board, use_table=True, **config):
+        """ Search board with the FiancoAI keyword arguments config, in the shared transposition table if use_table is set """
+        if not board.legal_moves:
+            return None
+        if self.pool is None:
+            self.pool = self.context.Pool(self.workers, initializer=init_worker, initargs=(self.stop_flag,))
+
+        if use_table:
+            transpositiontable.new_search()
+        tasks = [(board.white_pieces, board.black_pieces, board.player, START_DEPTHS[worker % len(START_DEPTHS)], worker or None, use_table, config)
+                 for worker in range(self.workers)]
+        results = self.pool.map(search_worker, tasks)
+
+        # Deepest finished iteration wins, ties go to the higher score
+        self.completed_depth, self.best_score, move, _ = max(results, key=lambda result: (result[0], result[1]))
+        self.nodes = sum(result[3] for result in results)
+        return move
+
+    def reset(self):
+        """ Let the next search run, called before it starts """
+        self.stop_flag.clear()
+
+    def stop(self):
+        """ Make the workers return their best moves so far, from another thread """
+        self.stop_flag.set()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
@@ -1,8 +1,9 @@
 import pygame
 import sys
 from chessboard import Chessboard
-from fiancoai import FiancoAI
-import time
+from aiworker import AIWorker
+from renderer import Renderer, game_over_message, game_winner
+from gamerecord import GameRecordWriter
 from parameters import *
 
 # Initialize pygame and screen dimensions
@@ -10,61 +11,14 @@ pygame.init()
 screen = pygame.display.set_mode((WIDTH, HEIGHT))
 pygame.display.set_caption("FIANCO")
 font = pygame.font.SysFont(None, FONT_SIZE)
+renderer = Renderer(screen, font)
 
 # Initialize game state
 chessboard = Chessboard()
-player1 = FiancoAI(chessboard, 1)
-player2 = FiancoAI(chessboard, 2)
+records = GameRecordWriter(GAME_RECORD_FILE) if GAME_RECORD_FILE else None
+players = {1: AIWorker(), 2: AIWorker()}
 selected_piece = None
 game_over = False
-delay = 0  # Delay for AI thinking
-
-# Draw the chess grid
-def draw_grid():
-    for x in range(MARGIN, MARGIN + BOARD_SIZE * CELL_SIZE + 1, CELL_SIZE):
-        pygame.draw.line(screen, BLACK, (x, MARGIN), (x, MARGIN + BOARD_SIZE * CELL_SIZE), 2)
-    for y in range(MARGIN, MARGIN + BOARD_SIZE * CELL_SIZE + 1, CELL_SIZE):
-        pygame.draw.line(screen, BLACK, (MARGIN, y), (MARGIN + BOARD_SIZE * CELL_SIZE, y), 2)
-
-# Draw the labels for grid coordinates and current player
-def draw_labels():
-    for i in range(BOARD_SIZE):
-        screen.blit(font.render(LETTERS[i], True, BLACK), (i * CELL_SIZE + MARGIN, FONT_SIZE // 2))
-        screen.blit(font.render(str(i + 1), True, BLACK), (10, MARGIN + i * CELL_SIZE))
-    
-    player_message = f"Player {chessboard.player}'s turn"
-    screen.blit(font.render(player_message, True, BLACK), (WIDTH // 2 - FONT_SIZE, HEIGHT - FONT_SIZE - 10))
-
-# Draw player pieces on the grid
-def draw_pieces():
-    for pos in chessboard.get_piece_positions(1):
-        pygame.draw.circle(screen, WHITE, 
-                           (pos[1] * CELL_SIZE + MARGIN + CELL_SIZE // 2, pos[0] * CELL_SIZE + MARGIN + CELL_SIZE // 2), 
-                           CELL_SIZE // 2 - 10)
-    for pos in chessboard.get_piece_positions(2):
-        pygame.draw.circle(screen, BLACK, 
-                           (pos[1] * CELL_SIZE + MARGIN + CELL_SIZE // 2, pos[0] * CELL_SIZE + MARGIN + CELL_SIZE // 2), 
-                           CELL_SIZE // 2 - 10)
-
-def draw_piece_number():
-    white_pieces = chessboard.count_pieces(1)
-    black_pieces = chessboard.count_pieces(2)
-    screen.blit(font.render(f"White: {white_pieces}", True, BLACK), (WIDTH - 10 * FONT_SIZE, HEIGHT - FONT_SIZE - 10))
-    screen.blit(font.render(f"Black: {black_pieces}", True, BLACK), (WIDTH - 10 * FONT_SIZE, HEIGHT - 2 * FONT_SIZE - 10))
-
-# Draw legal moves and selected piece highlights
-def draw_moves():
-    chessboard.legalmoves()
-    legal_moves = chessboard.legal_moves
-    if selected_piece:
-        pygame.draw.circle(screen, (255, 0, 0), 
-                           (selected_piece[1] * CELL_SIZE + MARGIN + CELL_SIZE // 2, selected_piece[0] * CELL_SIZE + MARGIN + CELL_SIZE // 2), 
-                           CELL_SIZE // 2 - 10)
-    for move in legal_moves:
-        # move[2] and move[3] are the destination coordinates (y1, x1)
-        pygame.draw.circle(screen, (0, 255, 0), 
-                           (move[3] * CELL_SIZE + MARGIN + CELL_SIZE // 2, move[2] * CELL_SIZE + MARGIN + CELL_SIZE // 2), 
-                           CELL_SIZE // 2 - 25)
 
 # Get the grid cell based on mouse position
 def get_cell_at_position(pos):
@@ -74,24 +28,24 @@ def get_cell_at_position(pos):
         return (y, x)
     return None
 
+# Append the game to the record file, with its winner if it is over
+def save_game():
+    if records:
+        records.write_board(chessboard, game_winner(chessboard))
+
 # Reset game to initial state
 def reset_game():
-    global chessboard, player2, selected_piece, game_over
+    global chessboard, selected_piece, game_over
+    for player in players.values():
+        player.cancel()
+    save_game()
     chessboard = Chessboard()
-    player2 = FiancoAI(chessboard, 2)
     selected_piece = None
     game_over = False
 
 # Check if the game has been won
 def check_game_over():
-    white_positions = chessboard.get_piece_positions(1)
-    black_positions = chessboard.get_piece_positions(2)
-    
-    if any(piece[0] == BOARD_SIZE - 1 for piece in white_positions):
-        return "Player 1 Wins!"
-    if any(piece[0] == 0 for piece in black_positions):
-        return "Player 2 Wins!"
-    return None
+    return game_over_message(chessboard)
 
 # Move a piece from one position to another
 def move_piece(from_pos, to_pos):
@@ -120,45 +74,35 @@ def handle_input():
 while True:
     for event in pygame.event.get():
         if event.type == pygame.QUIT:
+            save_game()
             pygame.quit()
             sys.exit()
         elif event.type == pygame.KEYDOWN:
             if event.key == pygame.K_BACKSPACE:
                 reset_game()
             elif event.key == pygame.K_u:
+                players[chessboard.player].cancel()
                 chessboard.undo()
-    
-    # Player 1 (AI) move
-    if chessboard.player == 1 and not game_over:
-        y0, x0, y1, x1 = player1.get_move()
-        if (y0, x0) and (y1, x1):
-            chessboard.move(1, [y0, x0], [y1, x1])
-        screen.blit(font.render("AI is thinking...", True, BLACK), (WIDTH // 2 - FONT_SIZE, HEIGHT // 2))
-        pygame.display.flip()
-        time.sleep(delay)
-    
-    # Player 2 (AI) move
-    elif chessboard.player == 2 and not game_over:
-        y0, x0, y1, x1 = player2.get_move()
-        if (y0, x0) and (y1, x1):
-            chessboard.move(2, [y0, x0], [y1, x1])
-        screen.blit(font.render("AI is thinking...", True, BLACK), (WIDTH // 2 - FONT_SIZE, HEIGHT // 2))
-        pygame.display.flip()
-        time.sleep(delay)
+                game_over = False
+        elif event.type == pygame.WINDOWEXPOSED:
+            renderer.invalidate()
+
+    # AI move for the player to move, searched in the background
+    ai = players[chessboard.player]
+    if not game_over:
+        if not ai.thinking:
+            ai.start(chessboard)
+        move = ai.poll(chessboard)
+        if move:
+            move_piece(move[:2], move[2:])
 
     handle_input()
 
     # Drawing and updating screen
-    screen.fill(GREY)
-    draw_grid()
-    draw_labels()
-    draw_pieces()
-    draw_moves()
-    draw_piece_number()
-
-    game_over_message = check_game_over()
-    if game_over_message:
-        screen.blit(font.render(game_over_message, True, BLACK), (WIDTH // 2 - FONT_SIZE, HEIGHT // 2))
+    message = check_game_over()
+    if message:
         game_over = True
-
-    pygame.display.flip()
\ No newline at end of file
+    elif players[chessboard.player].thinking:
+        message = players[chessboard.player].progress()
+    renderer.draw(chessboard, selected_piece, message)
+    renderer.tick()
@@ -0,0 +1,120 @@
+import math
+import time
+import numpy as np
+import vectorboard
+from chessboard import Chessboard
+from moves import decode_move, new_move_list
+from parameters import MCTS_BATCH, MCTS_EVAL_SCALE, MCTS_EXPLORATION, MCTS_LEAF_PLAYOUTS, MCTS_MAX_PLIES
+
+class Node:
+    """
+        Node of the Monte Carlo search tree
+
+        Attributes:
+        - move: Encoded move leading to the node from its parent
+        - mover: Player who made that move, wins is counted for them
+        - children: Expanded children
+        - untried: Legal moves not expanded yet
+        - visits: Playouts through the node, including those of the batch in flight
+        - wins: Summed playout scores of mover through the node, 1 for a win and 0 for a loss
+    """
+    __slots__ = ('move', 'mover', 'children', 'untried', 'visits', 'wins')
+
+    def __init__(self, move, mover, untried):
+        self.move = move
+        self.mover = mover
+        self.children = []
+        self.untried = untried
+        self.visits = 0
+        self.wins = 0.0
+
+    def select(self, exploration):
+        """ Child with the highest UCT value """
+        log_visits = math.log(self.visits)
+        return max(self.children, key=lambda child: child.wins / child.visits + exploration * math.sqrt(log_visits / child.visits))
+
+class MonteCarloSearch:
+    """
+        Monte Carlo tree search with batched random playouts
+
+        Every round selects several leaves by UCT, expands each by one move and plays
+        leaf_playouts random games from each of them, all games of the round in lockstep
+        with vectorboard.playouts. Games still running after max_plies are scored by the
+        evaluation. The playouts of a round are counted as visits while the leaves are
+        selected (a virtual loss), so the round spreads over different leaves.
+
+        Attributes:
+        - batch: Games played in lockstep per round
+        - leaf_playouts: Games played from each selected leaf
+        - exploration: UCT exploration constant
+        - max_plies: Plies after which a playout is scored by the evaluation
+        - scale: Evaluation units per logistic unit of that score
+        - rng: NumPy random generator of the playouts and the expansion order
+    """
+    def __init__(self, batch=MCTS_BATCH, leaf_playouts=MCTS_LEAF_PLAYOUTS, exploration=MCTS_EXPLORATION, max_plies=MCTS_MAX_PLIES, scale=MCTS_EVAL_SCALE, seed=None):
+        self.batch = batch
+        self.leaf_playouts = leaf_playouts
+        self.exploration = exploration
+        self.max_plies = max_plies
+        self.scale = scale
+        self.rng = np.random.default_rng(seed)
+        self.moves = new_move_list()
+
+    def legal_moves(self, board):
+        """ Shuffled legal moves of board, none once the game is won """
+        if board.check_winner():
+            return []
+        moves = list(self.moves[:board.generate_moves(self.moves)])
+        self.rng.shuffle(moves)
+        return moves
+
+    def search(self, ai):
+        """ Search ai.chessboard within the time and node limits of ai, returns the most visited move as (y0, x0, y1, x1)
+
+            ai.nodes counts the playouts as they finish; ai.stop() ends the search after the current round,
+            and ai.deadline can be moved while the search runs.
+        """
+        board = Chessboard.from_bitboards(ai.chessboard.white_pieces, ai.chessboard.black_pieces, ai.chessboard.player)
+        root = Node(0, board.player ^ 3, self.legal_moves(board))
+        if not root.untried:
+            return None
+        ai.deadline = time.perf_counter() + ai.time_limit
+        ai.nodes = 0
+        while not root.children or not ai.stopped and time.perf_counter() < ai.deadline and ai.nodes < ai.node_limit:
+            self.round(root, board, ai.weights)
+            ai.nodes += self.batch // self.leaf_playouts * self.leaf_playouts
+        best = max(root.children, key=lambda child: child.visits)
+        # Report the expected score of the move in percent
+        ai.completed_depth, ai.best_score = 1, round(100 * best.wins / best.visits)
+        return decode_move(best.move)
+
+    def round(self, root, board, weights):
+        """ Select, expand and play out batch // leaf_playouts leaves, then back up the results """
+        paths, positions = [], []
+        playouts = self.leaf_playouts
+        for _ in range(max(self.batch // playouts, 1)):
+            node, path = root, [root]
+            while not node.untried and node.children:
+                node = node.select(self.exploration)
+                board.make_move(node.move)
+                path.append(node)
+            if node.untried:
+                move = node.untried.pop()
+                mover = board.player
+                board.make_move(move)
+                node = Node(move, mover, self.legal_moves(board))
+                path[-1].children.append(node)
+                path.append(node)
+            for visited in path:
+                visited.visits += playouts
+            paths.append(path)
+            positions.append(tuple(map(int, (*vectorboard.split(board.white_pieces), *vectorboard.split(board.black_pieces), board.player))))
+            for _ in range(len(path) - 1):
+                board.undo_no_check()
+
+        # One row per leaf, repeated for each of its playouts
+        columns = np.repeat(np.array(positions, dtype=np.uint64), playouts, axis=0).T
+        scores = vectorboard.playouts(*columns[:4], columns[4].astype(np.int8), self.rng, self.max_plies, weights, self.scale)
+        for path, white_score in zip(paths, scores.reshape(len(paths), playouts).sum(axis=1)):
+            for node in path:
+                node.wins += white_score if node.mover == 1 else playouts - white_score
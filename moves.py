@@ -0,0 +1,55 @@
+import re
+from array import array
+from parameters import BOARD_SIZE, LETTERS, MAX_MOVES, MAX_PLY
+from tables import MIRROR_SQUARE, SQUARE_COORDS
+
+# A move is encoded as from_square | to_square << 7 | capture << 14 and fits in 16 bits
+SQUARE_MASK = 0x7F
+TO_SHIFT = 7
+CAPTURE_FLAG = 1 << 14
+
+def encode_move(y0, x0, y1, x1):
+    """ Encode the (y0, x0, y1, x1) form used by the front ends """
+    move = (y0 * BOARD_SIZE + x0) | (y1 * BOARD_SIZE + x1) << TO_SHIFT
+    return move | CAPTURE_FLAG if abs(y1 - y0) == 2 else move
+
+def decode_move(move):
+    """ Decode a move back to (y0, x0, y1, x1) """
+    return SQUARE_COORDS[move & SQUARE_MASK] + SQUARE_COORDS[(move >> TO_SHIFT) & SQUARE_MASK]
+
+def square_name(y, x):
+    """ Square as labelled on the board: file letter, then row number from 1, e.g. 'e1' """
+    return LETTERS[x].lower() + str(y + 1)
+
+def move_text(y0, x0, y1, x1):
+    """ Text form of a move, the two square names, e.g. 'e1e2' """
+    return square_name(y0, x0) + square_name(y1, x1)
+
+def parse_move(text):
+    """ (y0, x0, y1, x1) of a move in move_text form, ValueError if it is malformed """
+    match = re.fullmatch(r'([a-z])(\d+)([a-z])(\d+)', text.lower())
+    if not match:
+        raise ValueError(f"malformed move {text!r}")
+    file0, row0, file1, row1 = match.groups()
+    move = int(row0) - 1, LETTERS.lower().find(file0), int(row1) - 1, LETTERS.lower().find(file1)
+    if not all(0 <= coordinate < BOARD_SIZE for coordinate in move):
+        raise ValueError(f"move {text!r} is off the board")
+    return move
+
+def mirror_move(move):
+    """ The move reflected in the middle file, as played in the mirrored position """
+    return MIRROR_SQUARE[move & SQUARE_MASK] | MIRROR_SQUARE[(move >> TO_SHIFT) & SQUARE_MASK] << TO_SHIFT | move & CAPTURE_FLAG
+
+def move_from_square(move):
+    return move & SQUARE_MASK
+
+def move_to_square(move):
+    return (move >> TO_SHIFT) & SQUARE_MASK
+
+def new_move_list():
+    """ Preallocated buffer filled by Chessboard.generate_moves """
+    return array('H', [0]) * MAX_MOVES
+
+def new_move_lists(plies=MAX_PLY):
+    """ One reusable move buffer per search ply """
+    return [new_move_list() for _ in range(plies)]
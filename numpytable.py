@@ -0,0 +1,205 @@
+import mmap
+import os
+import numpy as np
+
+BUCKET_SIZE = 4
+AGE_MASK = 0x3F
+FLAG_EXACT = 1
+
+# Outcomes of a store, as in transposition_table.c
+STORE_KEPT = 0
+STORE_EMPTY = 1
+STORE_UPDATED = 2
+STORE_OVERWRITTEN = 3
+HEADER_SIZE = 64
+TABLE_MAGIC = b'FIANCOTT'
+TABLE_VERSION = 3  # As in transposition_table.c
+
+# Same layout as TableHeader in transposition_table.c
+HEADER_DTYPE = np.dtype([
+    ('age', np.uint32),
+    ('version', np.uint32),
+    ('magic', 'S8'),
+    ('seed', np.uint64),
+    ('buckets', np.uint64),
+    ('board_size', np.uint32),
+    ('reserved', np.uint8, 28),
+])
+
+# Same 16-byte layout as TranspositionEntry in transposition_table.c
+ENTRY_DTYPE = np.dtype([
+    ('zobrist_hash', np.uint64),  # Zobrist hash ^ entry data, see entry_data
+    ('score', np.int32),
+    ('move', np.uint16),
+    ('depth', np.uint8),
+    ('flag_age', np.uint8),  # Flag in the low 2 bits, search age in the high 6 bits
+])
+
+def entry_data(score, move, depth, flag_age):
+    """ The last 8 bytes of an entry as one integer, XORed into the stored key like in the C table """
+    return (score & 0xFFFFFFFF) | (move << 32) | (depth << 48) | (flag_age << 56)
+
+def pack_entries(scores, depths, flags, moves):
+    """ Pack entries the way tt_probe_or_store returns them: score << 32 | depth << 24 | flag << 16 | move """
+    return (scores.astype(np.int64) * (1 << 32)) | (depths.astype(np.int64) << 24) | (flags.astype(np.int64) << 16) | moves.astype(np.int64)
+
+class NumpyTranspositionTable:
+    """
+        Pure-NumPy transposition table with the semantics of transposition_table.c
+
+        The arrays live in an anonymous shared mapping behind a HEADER_SIZE header holding
+        the search age, so processes forked after resize() share the table. open() maps
+        them from a file instead, with the header checked like tt_open does.
+
+        Attributes:
+        - table: Structured array of shape (buckets, BUCKET_SIZE)
+        - words: The same memory as uint64 words of shape (buckets, BUCKET_SIZE, 2): key and data
+        - mask: Bucket index mask, the number of buckets is a power of two
+    """
+    def __init__(self, size_mb):
+        self.resize(size_mb)
+
+    @staticmethod
+    def bucket_count(size_mb):
+        buckets = 1
+        while buckets * 2 * BUCKET_SIZE * ENTRY_DTYPE.itemsize <= size_mb * 1024 * 1024:
+            buckets *= 2
+        return buckets
+
+    def use_buffer(self, buffer, buckets):
+        self.buffer = buffer
+        self.header = np.frombuffer(buffer, dtype=HEADER_DTYPE, count=1)
+        self.table = np.frombuffer(buffer, dtype=ENTRY_DTYPE, offset=HEADER_SIZE).reshape(buckets, BUCKET_SIZE)
+        self.words = self.table.view(np.uint64).reshape(buckets, BUCKET_SIZE, 2)
+        self.mask = buckets - 1
+
+    def resize(self, size_mb):
+        buckets = self.bucket_count(size_mb)
+        self.use_buffer(mmap.mmap(-1, HEADER_SIZE + buckets * BUCKET_SIZE * ENTRY_DTYPE.itemsize), buckets)
+        return 0
+
+    def open(self, path, size_mb, seed, board_size):
+        """ Map the table from path, returns 1 when earlier entries were kept and 0 for a fresh table """
+        buckets = self.bucket_count(size_mb)
+        size = HEADER_SIZE + buckets * BUCKET_SIZE * ENTRY_DTYPE.itemsize
+        with open(path, 'a+b') as file:
+            kept = False
+            if os.fstat(file.fileno()).st_size == size:
+                file.seek(0)
+                header = np.frombuffer(file.read(HEADER_SIZE), dtype=HEADER_DTYPE)[0]
+                kept = (header['magic'] == TABLE_MAGIC and header['version'] == TABLE_VERSION and header['seed'] == seed
+                        and header['buckets'] == buckets and header['board_size'] == board_size)
+            if not kept:
+                # Regrow the file sparse so every entry reads as empty
+                file.truncate(0)
+                file.truncate(size)
+            self.use_buffer(mmap.mmap(file.fileno(), size), buckets)
+        if not kept:
+            self.header[0] = (0, TABLE_VERSION, TABLE_MAGIC, seed, buckets, board_size, 0)
+        return int(kept)
+
+    def sync(self):
+        self.buffer.flush()
+        return 0
+
+    @property
+    def age(self):
+        return int(self.header['age'][0])
+
+    def clear(self):
+        self.header['age'] = 0
+        self.table.fill(0)
+
+    def new_search(self):
+        self.header['age'] = (self.age + 1) & AGE_MASK
+
+    def entries(self):
+        return self.table.size
+
+    def probe_or_store(self, zobrist_hash, store, move, flag, score, depth):
+        """ Scalar access with the same arguments and return values as tt_probe_or_store """
+        bucket = self.table[zobrist_hash & self.mask]
+        entries = bucket.tolist()
+
+        if not store:
+            for key, entry_score, entry_move, entry_depth, flag_age in entries:
+                if flag_age & 3 and key ^ entry_data(entry_score, entry_move, entry_depth, flag_age) == zobrist_hash:
+                    return (entry_score << 32) | (entry_depth << 24) | ((flag_age & 3) << 16) | entry_move
+            return 0
+
+        age = self.age
+        victim, victim_value, outcome = 0, None, STORE_OVERWRITTEN
+        for i, (key, entry_score, entry_move, entry_depth, flag_age) in enumerate(entries):
+            if not flag_age & 3:
+                victim, outcome = i, STORE_EMPTY
+                break
+            if key ^ entry_data(entry_score, entry_move, entry_depth, flag_age) == zobrist_hash:
+                # Keep a deeper result of the current search unless the new one is exact
+                if flag != FLAG_EXACT and depth + 2 < entry_depth and flag_age >> 2 == age:
+                    return STORE_KEPT
+                move = move or entry_move
+                victim, outcome = i, STORE_UPDATED
+                break
+            value = entry_depth - 8 * ((age - (flag_age >> 2)) & AGE_MASK)
+            if victim_value is None or value < victim_value:
+                victim, victim_value = i, value
+
+        depth, flag_age = min(max(depth, 0), 255), (age << 2) | (flag & 3)
+        bucket[victim] = (zobrist_hash ^ entry_data(score, move, depth, flag_age), score, move, depth, flag_age)
+        return outcome
+
+    def probe_many(self, zobrist_hashes):
+        """ Look up a batch of hashes with vectorized indexing, returns packed entries (0 on a miss) """
+        zobrist_hashes = np.asarray(zobrist_hashes, dtype=np.uint64)
+        rows = zobrist_hashes & np.uint64(self.mask)
+        buckets, words = self.table[rows], self.words[rows]
+        match = ((words[..., 0] ^ words[..., 1]) == zobrist_hashes[:, None]) & (buckets['flag_age'] & 3 != 0)
+        entries = buckets[np.arange(len(zobrist_hashes)), match.argmax(axis=1)]
+        packed = pack_entries(entries['score'], entries['depth'], entries['flag_age'] & 3, entries['move'])
+        packed[~match.any(axis=1)] = 0
+        return packed
+
+    def store_many(self, zobrist_hashes, moves, flags, scores, depths):
+        """ Store a batch of entries with the result of storing them one after another, like tt_store_many
+
+            Entries sharing a bucket with another entry of the batch depend on each other's
+            writes, so they are stored in order with probe_or_store. The entries alone in their
+            bucket are then stored at once with vectorized indexing.
+        """
+        zobrist_hashes = np.asarray(zobrist_hashes, dtype=np.uint64)
+        moves = np.asarray(moves, dtype=np.int64)
+        flags = np.asarray(flags, dtype=np.int64)
+        scores = np.asarray(scores, dtype=np.int64)
+        depths = np.clip(np.asarray(depths, dtype=np.int64), 0, 255)
+        rows = (zobrist_hashes & np.uint64(self.mask)).astype(np.int64)
+
+        _, inverse, counts = np.unique(rows, return_inverse=True, return_counts=True)
+        alone = counts[inverse] == 1
+        for i in np.flatnonzero(~alone):
+            self.probe_or_store(int(zobrist_hashes[i]), 1, int(moves[i]), int(flags[i]), int(scores[i]), int(depths[i]))
+        zobrist_hashes, moves, flags, scores, depths, rows = (array[alone] for array in (zobrist_hashes, moves, flags, scores, depths, rows))
+
+        buckets, words = self.table[rows], self.words[rows]
+        age = self.age
+
+        # As in probe_or_store: the first empty slot or entry of the same position, else the lowest replacement value
+        occupied = buckets['flag_age'] & 3 != 0
+        same = occupied & ((words[..., 0] ^ words[..., 1]) == zobrist_hashes[:, None])
+        ages = buckets['flag_age'].astype(np.int64) >> 2
+        values = buckets['depth'].astype(np.int64) - 8 * ((age - ages) & AGE_MASK)
+        found = same | ~occupied
+        slots = np.where(found.any(axis=1), found.argmax(axis=1), values.argmin(axis=1))
+
+        index = np.arange(len(rows))
+        old = buckets[index, slots]
+        has_same = same[index, slots]
+        keep_old = has_same & (flags != FLAG_EXACT) & (depths + 2 < old['depth']) & ((old['flag_age'] >> 2) == age)
+        moves = np.where(has_same & (moves == 0), old['move'], moves)
+
+        write = ~keep_old
+        rows, slots = rows[write], slots[write]
+        self.table['score'][rows, slots] = scores[write]
+        self.table['move'][rows, slots] = moves[write]
+        self.table['depth'][rows, slots] = depths[write]
+        self.table['flag_age'][rows, slots] = (age << 2) | (flags[write] & 3)
+        self.words[rows, slots, 0] = zobrist_hashes[write] ^ self.words[rows, slots, 1]
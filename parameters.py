@@ -4,8 +4,8 @@ BLACK = (0, 0, 0)
 GREY = (200, 200, 200)
 
 
-# AI Settings
-DELAY_AI = 1
+# Frame rate cap of the pygame front ends
+FPS = 30
 
 # Screen and Grid Sizes
 WIDTH, HEIGHT = 1000, 700
@@ -22,11 +22,11 @@ LETTERS = "ABCDEFGHI"
 WHITE_PIECE = 1
 BLACK_PIECE = 2
 
-# AI Best Value
-BEST_VALUE = -100
+# Evaluation weights, see evaluation.FEATURES (a piece is worth 100)
+EVAL_WEIGHTS = {'material': 100, 'advancement': 4, 'runners': 250}
 
-# Move History
-MAX_HISTORY = 30
+# Move History (initial number of plies, the history grows as needed)
+HISTORY_CAPACITY = 256
 
 # Initial Legal Moves
 INITIAL_LEGAL_MOVES = {
@@ -45,4 +45,41 @@ MAX = 2**64 - 1
 NUMBER_OF_PLAYERS = 2
 
 # Random Seed
-SEED = 420
\ No newline at end of file
+SEED = 420
+
+# Search Settings
+AI_TIME_LIMIT = 2.0  # Seconds per move
+AI_NODE_LIMIT = 2_000_000  # Nodes per move
+PONDER = True  # Search on the human's time in human-vs-AI play
+AI_MAX_DEPTH = 20
+MAX_PLY = 128  # Deepest ply a search can reach, sizes the per-ply move buffers
+MAX_MOVES = 64  # More than the legal moves of any position
+MAX_PIECES = 15  # Pieces per side at the start, no position has more
+WIN_SCORE = 100_000
+WIN_THRESHOLD = WIN_SCORE - 1000  # Scores beyond this are forced wins or losses
+INFINITY = 1_000_000
+
+# Monte Carlo tree search: games played in lockstep per playout batch, playouts per
+# selected leaf, UCT exploration constant, plies after which a playout is cut off and
+# scored by the evaluation, and evaluation units per logistic unit of that score (the
+# sigmoid scale tune.py fits)
+MCTS_BATCH = 2048
+MCTS_LEAF_PLAYOUTS = 16
+MCTS_EXPLORATION = 1.4
+MCTS_MAX_PLIES = 24
+MCTS_EVAL_SCALE = 400
+
+# Transposition Table Size (overridden by the FIANCO_TT_MB environment variable)
+TT_SIZE_MB = 64
+
+# File the transposition table is kept in between runs, None for a table in memory only
+# (overridden by the FIANCO_TT_FILE environment variable)
+TT_FILE = None
+
+# Endgame tablebase: pieces per side and in total it covers, and the file the search loads it from
+TABLEBASE_PIECES = 2
+TABLEBASE_TOTAL = 3
+TABLEBASE_FILE = 'endgame.ftb'
+
+# Append-only file the front ends record finished games to, None to not record them
+GAME_RECORD_FILE = 'games.fgr'
@@ -0,0 +1,185 @@
+import argparse
+import random
+import sys
+import time
+from chessboard import Chessboard
+from fiancoai import FiancoAI
+from moves import decode_move, move_to_square, new_move_list, new_move_lists
+from parameters import BOARD_SIZE, INFINITY, WIN_SCORE, WIN_THRESHOLD
+
+# Saved positions as (name, white_pieces, black_pieces, player, {depth: leaf nodes})
+# The game ends when a piece reaches the last row, so such positions have no moves.
+PERFT_POSITIONS = [
+    ('initial', 0x1411105ff, 0x1ff411105000000000000, 1, {1: 25, 2: 623, 3: 14975, 4: 356399, 5: 8419237}),
+    ('opening', 0x1610184ff, 0xfb822544800000000000, 1, {1: 22, 2: 629, 3: 13827, 4: 386308}),
+    ('capture', 0x123200bfd, 0x1ce8a8905040000000000, 1, {1: 1, 2: 27, 3: 651, 4: 14977}),
+    ('middlegame', 0x400002040100c39d, 0x12fa41000800000000000, 2, {1: 20, 2: 410, 3: 7747, 4: 164594}),
+    ('endgame', 0x10000090000, 0x8208000000000000, 1, {1: 9, 2: 58, 3: 407, 4: 2868, 5: 21092}),
+]
+
+# Positions whose only move is a capture onto the last row, which quiescence must score as a win
+# for the player to move even with a narrow window: (name, white_pieces, black_pieces, player)
+WINNING_CAPTURES = [
+    ('promotion capture', 0x400000000000000, 0x107100000000000000000, 1),
+]
+
+def perft(board, depth, move_lists=None):
+    """ Count the leaf nodes of the move tree to the given depth """
+    move_lists = move_lists or new_move_lists(depth + 1)
+    moves = move_lists[depth]
+    count = board.generate_moves(moves)
+    if depth == 1:
+        return count
+
+    nodes = 0
+    last_row = BOARD_SIZE - 1 if board.player == 1 else 0
+    for i in range(count):
+        move = moves[i]
+        if move_to_square(move) // BOARD_SIZE == last_row:
+            continue  # The game is over, there are no moves below this one
+        board.make_move(move)
+        nodes += perft(board, depth - 1, move_lists)
+        board.undo_no_check()
+    return nodes
+
+def divide(board, depth):
+    """ Leaf node count below each root move, sorted by (y0, x0, y1, x1) """
+    counts = {}
+    moves = new_move_list()
+    count = board.generate_moves(moves)
+    move_lists = new_move_lists(depth)
+    last_row = BOARD_SIZE - 1 if board.player == 1 else 0
+    for move in sorted(moves[:count], key=decode_move):
+        if depth == 1:
+            counts[decode_move(move)] = 1
+        elif move_to_square(move) // BOARD_SIZE == last_row:
+            counts[decode_move(move)] = 0
+        else:
+            board.make_move(move)
+            counts[decode_move(move)] = perft(board, depth - 1, move_lists)
+            board.undo_no_check()
+    return counts
+
+def run_perft(board, depth):
+    """ Return (nodes, seconds) for one perft run """
+    start = time.perf_counter()
+    nodes = perft(board, depth)
+    return nodes, time.perf_counter() - start
+
+def run_suite(max_depth=None):
+    """ Check every saved position against its reference counts and report nodes/sec, returns True if all match """
+    all_ok = True
+    total_nodes, total_time = 0, 0.0
+    for name, white_pieces, black_pieces, player, expected in PERFT_POSITIONS:
+        board = Chessboard.from_bitboards(white_pieces, black_pieces, player)
+        for depth, reference in sorted(expected.items()):
+            if max_depth and depth > max_depth:
+                break
+            nodes, seconds = run_perft(board, depth)
+            total_nodes += nodes
+            total_time += seconds
+            ok = nodes == reference
+            all_ok &= ok
+            print(f"{name:<12} depth {depth}  {nodes:>10}  {'ok' if ok else f'FAIL (expected {reference})':<8}  "
+                  f"{seconds:8.3f}s  {nodes / max(seconds, 1e-9):12.0f} nodes/s")
+    print(f"total {total_nodes} nodes in {total_time:.3f}s, {total_nodes / max(total_time, 1e-9):.0f} nodes/s")
+    return all_ok
+
+def brute_force(ai, depth):
+    """ Negamax score of ai.chessboard without pruning or transposition table, over the same quiescence search """
+    board = ai.chessboard
+    if depth <= 0:
+        return ai.quiescence(-INFINITY, INFINITY)
+    moves = ai.move_lists[ai.ply]
+    count = board.generate_moves(moves)
+    if not count:
+        return -WIN_SCORE + ai.ply
+    best = -INFINITY
+    last_row = BOARD_SIZE - 1 if board.player == 1 else 0
+    for move in moves[:count]:
+        board.make_move(move)
+        ai.ply += 1
+        if move_to_square(move) // BOARD_SIZE == last_row:
+            score = WIN_SCORE - ai.ply
+        else:
+            score = -brute_force(ai, depth - 1)
+        board.undo_no_check()
+        ai.ply -= 1
+        best = max(best, score)
+    return best
+
+def random_positions(count, seed, min_plies=4, max_plies=30):
+    """ (white_pieces, black_pieces, player) of positions reached by random play that are not decided yet """
+    rng = random.Random(seed)
+    positions = []
+    while len(positions) < count:
+        board = Chessboard()
+        for _ in range(rng.randint(min_plies, max_plies)):
+            moves = sorted(board.legal_moves)
+            if not moves or board.check_winner():
+                break
+            y0, x0, y1, x1 = rng.choice(moves)
+            board.move(board.player, (y0, x0), (y1, x1))
+        if board.legal_moves and not board.check_winner():
+            positions.append((board.white_pieces, board.black_pieces, board.player))
+    return positions
+
+def check_search(count=50, depths=(2, 3), seed=0):
+    """ Compare the root score of FiancoAI.search with brute_force on random positions, returns True if all match """
+    mismatches = 0
+    for white_pieces, black_pieces, player in random_positions(count, seed):
+        for depth in depths:
+            board = Chessboard.from_bitboards(white_pieces, black_pieces, player)
+            ai = FiancoAI(board, player, time_limit=INFINITY, node_limit=INFINITY, max_depth=depth, table=None, use_tablebase=False)
+            ai.search()
+            reference = brute_force(ai, depth)
+            if ai.best_score != reference:
+                mismatches += 1
+                print(f"position {white_pieces:#x} {black_pieces:#x} {player} depth {depth}: search {ai.best_score}, brute force {reference}")
+    for name, white_pieces, black_pieces, player in WINNING_CAPTURES:
+        ai = FiancoAI(Chessboard.from_bitboards(white_pieces, black_pieces, player), player, table=None, use_tablebase=False)
+        score = ai.quiescence(-100, 100)
+        if score < WIN_THRESHOLD:
+            mismatches += 1
+            print(f"{name}: quiescence {score}, expected a win")
+    print(f"search check: {mismatches} mismatches in {count * len(depths) + len(WINNING_CAPTURES)} searches")
+    return not mismatches
+
+def depth_argument(text):
+    depth = int(text)
+    if depth < 1:
+        raise argparse.ArgumentTypeError("depth must be at least 1")
+    return depth
+
+def main():
+    parser = argparse.ArgumentParser(description="Fianco perft: move generator correctness and speed")
+    parser.add_argument('--depth', type=depth_argument, default=4)
+    parser.add_argument('--position', default='initial', choices=[position[0] for position in PERFT_POSITIONS])
+    parser.add_argument('--divide', action='store_true', help="print the node count below every root move")
+    parser.add_argument('--suite', action='store_true', help="check all saved positions against the reference counts")
+    parser.add_argument('--max-depth', type=int, default=None, help="deepest reference count checked by --suite")
+    parser.add_argument('--search', action='store_true', help="check the alpha-beta root scores against a brute-force negamax, and quiescence on WINNING_CAPTURES")
+    args = parser.parse_args()
+
+    if args.suite:
+        sys.exit(0 if run_suite(args.max_depth) else 1)
+    if args.search:
+        sys.exit(0 if check_search() else 1)
+
+    _, white_pieces, black_pieces, player, expected = next(position for position in PERFT_POSITIONS if position[0] == args.position)
+    board = Chessboard.from_bitboards(white_pieces, black_pieces, player)
+    if args.divide:
+        start = time.perf_counter()
+        counts = divide(board, args.depth)
+        seconds = time.perf_counter() - start
+        for (y0, x0, y1, x1), count in counts.items():
+            print(f"{y0} {x0} {y1} {x1}: {count}")
+        nodes = sum(counts.values())
+    else:
+        nodes, seconds = run_perft(board, args.depth)
+    reference = expected.get(args.depth)
+    status = '' if reference is None else ' ok' if nodes == reference else f' FAIL (expected {reference})'
+    print(f"depth {args.depth}: {nodes} nodes{status}, {seconds:.3f}s, {nodes / max(seconds, 1e-9):.0f} nodes/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import pygame
+from chessboard import game_winner
+from parameters import *
+
+HIGHLIGHT = (255, 0, 0)
+MOVE_MARKER = (0, 255, 0)
+
+class Renderer:
+    """
+        Cached pygame rendering of a chessboard
+
+        The grid and coordinate labels are drawn once on a background surface, text is
+        rendered once per distinct string, and a frame is only redrawn when what it shows
+        changes. Moves and game-over state are read from the board, not recomputed.
+
+        Attributes:
+        - screen: Display surface
+        - font: Font for labels and messages
+        - label_font: Font for the row numbers
+        - show_hash: Draw the Zobrist hash of the position
+        - show_counts: Draw the number of pieces of each player
+    """
+    def __init__(self, screen, font, label_font=None, show_hash=False, show_counts=True, fps=FPS):
+        self.screen = screen
+        self.font = font
+        self.label_font = label_font or font
+        self.show_hash = show_hash
+        self.show_counts = show_counts
+        self.fps = fps
+        self.clock = pygame.time.Clock()
+        self.text_cache = {}
+        self.background = self.draw_background()
+        self.last_frame = None
+
+    def text(self, message, font=None):
+        font = font or self.font
+        key = (message, id(font))
+        surface = self.text_cache.get(key)
+        if surface is None:
+            surface = self.text_cache[key] = font.render(message, True, BLACK)
+        return surface
+
+    def draw_background(self):
+        background = pygame.Surface(self.screen.get_size())
+        background.fill(GREY)
+        for x in range(MARGIN, MARGIN + BOARD_SIZE * CELL_SIZE + 1, CELL_SIZE):
+            pygame.draw.line(background, BLACK, (x, MARGIN), (x, MARGIN + BOARD_SIZE * CELL_SIZE), 2)
+        for y in range(MARGIN, MARGIN + BOARD_SIZE * CELL_SIZE + 1, CELL_SIZE):
+            pygame.draw.line(background, BLACK, (MARGIN, y), (MARGIN + BOARD_SIZE * CELL_SIZE, y), 2)
+        for i in range(BOARD_SIZE):
+            background.blit(self.text(LETTERS[i]), (i * CELL_SIZE + MARGIN, FONT_SIZE // 2))
+            background.blit(self.text(str(i + 1), self.label_font), (10, MARGIN + i * CELL_SIZE))
+        return background
+
+    def cell_center(self, y, x):
+        return x * CELL_SIZE + MARGIN + CELL_SIZE // 2, y * CELL_SIZE + MARGIN + CELL_SIZE // 2
+
+    def draw(self, chessboard, selected_piece=None, message=None):
+        """ Redraw and flip the display if the position, selection or message changed since the last frame """
+        frame = (chessboard.zobrist_hash, chessboard.white_pieces, chessboard.black_pieces, selected_piece, message)
+        if frame == self.last_frame:
+            return False
+        self.last_frame = frame
+
+        screen = self.screen
+        screen.blit(self.background, (0, 0))
+        screen.blit(self.text(f"Player {chessboard.player}'s turn"), (WIDTH // 2 - FONT_SIZE, HEIGHT - FONT_SIZE - 10))
+        if self.show_hash:
+            screen.blit(self.text(f"HASH: {bin(chessboard.zobrist_hash)}"), (10, HEIGHT - 2 * FONT_SIZE - 10))
+        if self.show_counts:
+            screen.blit(self.text(f"White: {chessboard.count_pieces(1)}"), (WIDTH - 10 * FONT_SIZE, HEIGHT - FONT_SIZE - 10))
+            screen.blit(self.text(f"Black: {chessboard.count_pieces(2)}"), (WIDTH - 10 * FONT_SIZE, HEIGHT - 2 * FONT_SIZE - 10))
+
+        for player, color in ((1, WHITE), (2, BLACK)):
+            for y, x in chessboard.iter_pieces(player):
+                pygame.draw.circle(screen, color, self.cell_center(y, x), CELL_SIZE // 2 - 10)
+
+        if selected_piece:
+            pygame.draw.circle(screen, HIGHLIGHT, self.cell_center(*selected_piece), CELL_SIZE // 2 - 10)
+        for move in chessboard.legal_moves:
+            pygame.draw.circle(screen, MOVE_MARKER, self.cell_center(move[2], move[3]), CELL_SIZE // 2 - 25)
+
+        if message:
+            screen.blit(self.text(message), (WIDTH // 2 - FONT_SIZE, HEIGHT // 2))
+        pygame.display.flip()
+        return True
+
+    def invalidate(self):
+        """ Force a redraw on the next draw call, e.g. after the window was exposed """
+        self.last_frame = None
+
+    def tick(self):
+        """ Cap the frame rate; the loop sleeps here instead of spinning """
+        return self.clock.tick(self.fps)
+
+def game_over_message(chessboard):
+    """ Winner message from the board state, or None while the game goes on """
+    winner = game_winner(chessboard)
+    return f"Player {winner} Wins!" if winner else None
@@ -0,0 +1,66 @@
+import json
+import time
+
+class SearchStats:
+    """
+        Counters of one search, collected by FiancoAI and the transposition table wrapper
+
+        Attach an instance to FiancoAI(stats=...) to collect them; without one the search only
+        pays for a few None checks. Counters are reset at the start of every move and read with
+        as_dict(), or appended to output as one JSON line per move.
+
+        Attributes:
+        - nodes: Nodes searched, quiescence nodes included
+        - qnodes: Quiescence nodes searched
+        - beta_cutoffs: Nodes that failed high
+        - first_move_cutoffs: Fail-highs on the first move searched, a measure of move ordering
+        - tt_probes, tt_hits: Table lookups and the ones that found the position
+        - tt_collisions: Hits whose stored move is not legal in the position, so the key matched another position
+        - tt_stores, tt_overwrites: Table writes and the ones that replaced a different position
+        - iterations: (depth, nodes, seconds) of every finished iterative-deepening iteration, nodes of that iteration alone
+        - output: Text file the JSON lines are appended to, or None
+        - tags: Fields added to every JSON line, e.g. the game and engine in a self-play run
+    """
+    COUNTERS = ('nodes', 'qnodes', 'beta_cutoffs', 'first_move_cutoffs', 'tt_probes', 'tt_hits', 'tt_collisions', 'tt_stores', 'tt_overwrites')
+
+    def __init__(self, output=None, **tags):
+        self.output = output
+        self.tags = tags
+        self.reset()
+
+    def reset(self):
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        self.iterations = []
+        self.start_time = self.iteration_start = time.perf_counter()
+        self.end_time = None
+
+    def start_iteration(self):
+        self.iteration_start = time.perf_counter()
+
+    def end_iteration(self, depth, nodes):
+        """ Record a finished iteration, nodes counts every node of the move so far """
+        previous = sum(iteration[1] for iteration in self.iterations)
+        self.iterations.append((depth, nodes - previous, time.perf_counter() - self.iteration_start))
+
+    def effective_branching_factor(self):
+        """ Node ratio of the last two finished iterations, 0 with fewer than two """
+        if len(self.iterations) < 2 or not self.iterations[-2][1]:
+            return 0.0
+        return self.iterations[-1][1] / self.iterations[-2][1]
+
+    def as_dict(self):
+        stats = {name: getattr(self, name) for name in self.COUNTERS}
+        stats['first_move_cutoff_rate'] = self.first_move_cutoffs / self.beta_cutoffs if self.beta_cutoffs else 0.0
+        stats['tt_hit_rate'] = self.tt_hits / self.tt_probes if self.tt_probes else 0.0
+        stats['effective_branching_factor'] = self.effective_branching_factor()
+        stats['time_per_depth'] = {depth: seconds for depth, _, seconds in self.iterations}
+        stats['time'] = (self.end_time or time.perf_counter()) - self.start_time
+        return stats
+
+    def finish(self, **extra):
+        """ End the move: write its JSON line if there is an output, extra fields are added to the line """
+        self.end_time = time.perf_counter()
+        if self.output is not None:
+            self.output.write(json.dumps({**self.tags, **self.as_dict(), **extra}) + '\n')
+            self.output.flush()
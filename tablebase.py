@@ -0,0 +1,258 @@
+"""
+    Endgame tablebase for positions with at most K pieces per side, and optionally at
+    most a given number of pieces in total
+
+    generate() solves every position of each material signature (white count, black count)
+    by retrograde analysis, fewest pieces first so captures lead into solved tables. Each
+    position gets one byte: 0 for a draw, otherwise the number of plies to the end of the
+    game plus one. Wins are an odd number of plies away and losses an even number, so the
+    byte says both who wins and how fast.
+
+    Positions are indexed by the colex rank of the white squares among the rank-canonical
+    half of the left-right mirror pairs, the colex rank of the black squares and the player
+    to move. The file is memory-mapped by Tablebase, so a probe is a few table lookups.
+"""
+import argparse
+import heapq
+import itertools
+import mmap
+import os
+import struct
+import time
+from array import array
+from math import comb
+from chessboard import Chessboard
+from moves import CAPTURE_FLAG, SQUARE_MASK, TO_SHIFT, new_move_list
+from parameters import BOARD_SIZE, TABLEBASE_FILE, TABLEBASE_PIECES, TABLEBASE_TOTAL, WIN_SCORE
+from tables import MIRROR_SQUARE, PROMOTION_ROW, SQUARE_BIT, SQUARES
+
+MAGIC = b'FIANCOTB'
+VERSION = 1
+FILE_HEADER = struct.Struct('<8sHBBI')  # magic, version, board size, pieces per side, number of tables
+SIGNATURE = struct.Struct('<BBxxxxxxQQ')  # white count, black count, offset, size
+
+MAX_DISTANCE = 254
+
+def squares_of(bitboard):
+    squares = []
+    while bitboard:
+        bit = bitboard & -bitboard
+        bitboard ^= bit
+        squares.append(bit.bit_length() - 1)
+    return squares
+
+def combination_rank(squares):
+    """ Colex rank of ascending squares among all sets of the same size """
+    return sum(comb(square, i + 1) for i, square in enumerate(squares))
+
+class SignatureIndex:
+    """
+        Dense index of the positions with a given number of white and black pieces
+
+        Attributes:
+        - white_count, black_count: Pieces of each side
+        - dense: Index of every white square set among the canonical ones, -1 for mirrored sets
+        - white_sets: Canonical white square sets in index order
+        - size: Number of index slots, two players per (white set, black set)
+    """
+    def __init__(self, white_count, black_count):
+        self.white_count, self.black_count = white_count, black_count
+        self.black_sets = comb(SQUARES, black_count)
+        self.dense = array('i', [-1]) * comb(SQUARES, white_count)
+        self.white_sets = []
+        for squares in itertools.combinations(range(SQUARES), white_count):
+            rank = combination_rank(squares)
+            if rank <= combination_rank(sorted(MIRROR_SQUARE[square] for square in squares)):
+                self.dense[rank] = len(self.white_sets)
+                self.white_sets.append(squares)
+        self.size = 2 * len(self.white_sets) * self.black_sets
+
+    def index(self, white_pieces, black_pieces, player):
+        white, black = squares_of(white_pieces), squares_of(black_pieces)
+        dense = self.dense[combination_rank(white)]
+        if dense < 0:
+            dense = self.dense[combination_rank(sorted(MIRROR_SQUARE[square] for square in white))]
+            black = sorted(MIRROR_SQUARE[square] for square in black)
+        return (dense * self.black_sets + combination_rank(black)) * 2 + player - 1
+
+def signatures(max_pieces, max_total=None):
+    """ Material signatures in the order they are solved: fewer pieces first """
+    max_total = max_total or 2 * max_pieces
+    pieces = range(1, max_pieces + 1)
+    return sorted(((white, black) for white in pieces for black in pieces if white + black <= max_total), key=sum)
+
+def generate(max_pieces=TABLEBASE_PIECES, max_total=TABLEBASE_TOTAL, verbose=True):
+    """ Solve every signature with up to max_pieces per side and max_total in all, returns {signature: bytearray} """
+    solved = {}
+    indexes = {}
+    board = Chessboard()
+    moves = new_move_list()
+    for signature in signatures(max_pieces, max_total):
+        start = time.perf_counter()
+        index = indexes[signature] = SignatureIndex(*signature)
+        solved[signature] = solve(index, solved, indexes, board, moves)
+        if verbose:
+            values = solved[signature]
+            wins = sum(1 for value in values if value & 1 == 0 and value)
+            print(f"{signature[0]}v{signature[1]}: {index.size} slots, {wins} wins in {time.perf_counter() - start:.1f}s", flush=True)
+    return solved
+
+def solve(index, solved, indexes, board, moves):
+    """ Retrograde analysis of one signature
+
+        Events (distance, slot, value) are processed in order of distance: a position wins
+        one ply after its first losing child and loses one ply after its last child resolved,
+        all of them wins for the opponent. Positions never resolved are draws.
+    """
+    values = bytearray(index.size)
+    remaining = {}
+    longest = {}
+    predecessors = {}
+    events = []
+    white_count, black_count = index.white_count, index.black_count
+
+    for white_squares in index.white_sets:
+        white_pieces = sum(SQUARE_BIT[square] for square in white_squares)
+        if white_pieces & PROMOTION_ROW[1]:
+            continue
+        for black_squares in itertools.combinations(range(SQUARES), black_count):
+            black_pieces = sum(SQUARE_BIT[square] for square in black_squares)
+            if black_pieces & (white_pieces | PROMOTION_ROW[2]):
+                continue
+            for player in (1, 2):
+                slot = index.index(white_pieces, black_pieces, player)
+                board.white_pieces, board.black_pieces, board.player = white_pieces, black_pieces, player
+                board.empty_squares = ~(white_pieces | black_pieces) & ((1 << SQUARES) - 1)
+                count = board.generate_moves(moves)
+                if not count:
+                    heapq.heappush(events, (0, slot, 1))  # A player that cannot move loses
+                    continue
+                remaining[slot] = count
+                for i in range(count):
+                    child = child_value(moves[i], white_pieces, black_pieces, player, index, solved, indexes)
+                    if isinstance(child, int):
+                        predecessors.setdefault(child, []).append(slot)
+                    elif child:
+                        # Child already decided: a promotion, or a capture into a smaller table
+                        distance, value = child
+                        heapq.heappush(events, (distance, -1 - slot, value))
+
+    while events:
+        distance, slot, value = heapq.heappop(events)
+        if slot < 0:
+            # A resolved child of -1 - slot
+            resolve_child(-1 - slot, distance, value, values, remaining, longest, events)
+            continue
+        if values[slot]:
+            continue
+        values[slot] = value
+        for parent in predecessors.get(slot, ()):
+            resolve_child(parent, distance, value, values, remaining, longest, events)
+    return values
+
+def resolve_child(slot, distance, value, values, remaining, longest, events):
+    if values[slot] or distance >= MAX_DISTANCE:
+        return
+    if value & 1:
+        # The child is lost for its player to move, so this position wins
+        heapq.heappush(events, (distance + 1, slot, distance + 2))
+        return
+    remaining[slot] -= 1
+    longest[slot] = max(longest.get(slot, 0), distance)
+    if not remaining[slot]:
+        heapq.heappush(events, (longest[slot] + 1, slot, longest[slot] + 2))
+
+def child_value(move, white_pieces, black_pieces, player, index, solved, indexes):
+    """ Slot of the child position in the same signature, (distance, value) when it is already decided, None for a drawn child """
+    from_bit = SQUARE_BIT[move & SQUARE_MASK]
+    to_bit = SQUARE_BIT[(move >> TO_SHIFT) & SQUARE_MASK]
+    if to_bit & PROMOTION_ROW[player]:
+        return 0, 1  # The child is lost at once: the mover reached the last row
+    captured = SQUARE_BIT[((move & SQUARE_MASK) + ((move >> TO_SHIFT) & SQUARE_MASK)) >> 1] if move & CAPTURE_FLAG else 0
+    if player == 1:
+        white_pieces ^= from_bit | to_bit
+        black_pieces ^= captured
+    else:
+        black_pieces ^= from_bit | to_bit
+        white_pieces ^= captured
+    if not captured:
+        return index.index(white_pieces, black_pieces, player ^ 3)
+    signature = (white_pieces.bit_count(), black_pieces.bit_count())
+    if 0 in signature:
+        return 0, 1  # The opponent has no piece left to move
+    value = solved[signature][indexes[signature].index(white_pieces, black_pieces, player ^ 3)]
+    return (value - 1, value) if value else None
+
+def write(path, solved):
+    """ Write solved tables: FILE_HEADER, one SIGNATURE record per table, then the tables """
+    order = sorted(solved, key=sum)
+    offset = FILE_HEADER.size + SIGNATURE.size * len(order)
+    with open(path, 'wb') as file:
+        file.write(FILE_HEADER.pack(MAGIC, VERSION, BOARD_SIZE, max(max(signature) for signature in order), len(order)))
+        for signature in order:
+            file.write(SIGNATURE.pack(*signature, offset, len(solved[signature])))
+            offset += len(solved[signature])
+        for signature in order:
+            file.write(solved[signature])
+
+class Tablebase:
+    """
+        Memory-mapped tablebase file with O(1) probes
+
+        Attributes:
+        - max_pieces: Largest number of pieces per side in the file
+        - max_total: Largest number of pieces on the board in the file
+        - tables: {(white count, black count): (SignatureIndex, memoryview of the values)}
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as file:
+            self.buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, board_size, self.max_pieces, count = FILE_HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION or board_size != BOARD_SIZE:
+            raise ValueError(f"{path} is not a version {VERSION} tablebase for a {BOARD_SIZE}x{BOARD_SIZE} board")
+        self.tables = {}
+        view = memoryview(self.buffer)
+        for i in range(count):
+            white_count, black_count, offset, size = SIGNATURE.unpack_from(self.buffer, FILE_HEADER.size + i * SIGNATURE.size)
+            self.tables[white_count, black_count] = (SignatureIndex(white_count, black_count), view[offset:offset + size])
+        self.max_total = max(map(sum, self.tables))
+
+    def probe(self, white_pieces, black_pieces, player):
+        """ Byte value of the position (0 for a draw), or None if the tablebase does not cover it """
+        table = self.tables.get((white_pieces.bit_count(), black_pieces.bit_count()))
+        if table is None:
+            return None
+        index, values = table
+        return values[index.index(white_pieces, black_pieces, player)]
+
+    def probe_score(self, white_pieces, black_pieces, player, ply):
+        """ Search score of the position for the player to move at ply, or None if not covered """
+        value = self.probe(white_pieces, black_pieces, player)
+        if not value:
+            return value
+        plies = ply + value - 1  # Ply at which the game ends
+        return WIN_SCORE - plies if value & 1 == 0 else -WIN_SCORE + plies
+
+tablebase = None
+
+def default_tablebase():
+    """ The tablebase in TABLEBASE_FILE next to this module or in the working directory, loaded once, or None """
+    global tablebase
+    if tablebase is None and TABLEBASE_FILE:
+        for directory in (os.path.dirname(os.path.abspath(__file__)), os.getcwd()):
+            path = os.path.join(directory, TABLEBASE_FILE)
+            if os.path.exists(path):
+                tablebase = Tablebase(path)
+                break
+    return tablebase
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the Fianco endgame tablebase")
+    parser.add_argument('--pieces', type=int, default=TABLEBASE_PIECES, help="largest number of pieces per side")
+    parser.add_argument('--total', type=int, default=TABLEBASE_TOTAL, help="largest number of pieces on the board")
+    parser.add_argument('--output', default=TABLEBASE_FILE)
+    args = parser.parse_args()
+    write(args.output, generate(args.pieces, args.total))
+
+if __name__ == "__main__":
+    main()
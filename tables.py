@@ -0,0 +1,55 @@
+"""
+    Bitboard lookup tables, built once at import from BOARD_SIZE
+
+    Square numbers are y * BOARD_SIZE + x, with white starting on row 0 and moving down,
+    black starting on the last row and moving up. Tables indexed by player use 1 for white
+    and 2 for black; index 0 is unused.
+"""
+from parameters import BOARD_SIZE
+
+SQUARES = BOARD_SIZE * BOARD_SIZE
+FULL_BOARD = (1 << SQUARES) - 1
+
+# Single-square bitboards and (y, x) coordinates
+SQUARE_BIT = [1 << square for square in range(SQUARES)]
+SQUARE_COORDS = [divmod(square, BOARD_SIZE) for square in range(SQUARES)]
+
+# Square reflected in the middle file: the board is left-right symmetric
+MIRROR_SQUARE = [(square // BOARD_SIZE) * BOARD_SIZE + BOARD_SIZE - 1 - square % BOARD_SIZE for square in range(SQUARES)]
+
+# Row and file masks
+ROW_MASKS = [((1 << BOARD_SIZE) - 1) << (row * BOARD_SIZE) for row in range(BOARD_SIZE)]
+FILE_MASKS = [sum(1 << (row * BOARD_SIZE + col) for row in range(BOARD_SIZE)) for col in range(BOARD_SIZE)]
+FIRST_ROW, LAST_ROW = ROW_MASKS[0], ROW_MASKS[-1]
+FIRST_FILE, LAST_FILE = FILE_MASKS[0], FILE_MASKS[-1]
+
+# File masks used by the shift-based move generator
+NOT_FIRST_FILE = FULL_BOARD & ~FIRST_FILE
+NOT_LAST_FILE = FULL_BOARD & ~LAST_FILE
+NOT_FIRST_TWO_FILES = NOT_FIRST_FILE & ~FILE_MASKS[1]
+NOT_LAST_TWO_FILES = NOT_LAST_FILE & ~FILE_MASKS[-2]
+
+# Row a player wins on, and the row one step before it
+PROMOTION_ROW = [0, LAST_ROW, FIRST_ROW]
+PRE_PROMOTION_ROW = [0, ROW_MASKS[-2], ROW_MASKS[1]]
+
+def mirror_swaps(files):
+    """ (delta, mask) swaps reversing the given consecutive files: each swaps the files in mask with those delta to the right """
+    if len(files) < 2:
+        return []
+    half = len(files) // 2
+    delta = len(files) - half
+    # Swap the outer halves, an odd middle file stays in place, then reverse both halves at once
+    return [(delta, sum(FILE_MASKS[file] for file in files[:half]))] + [
+        (inner_delta, mask | mask << delta) for inner_delta, mask in mirror_swaps(files[:half])
+    ]
+
+# Delta swaps mirroring a bitboard in the middle file, see mirror_bitboard
+MIRROR_SWAPS = mirror_swaps(list(range(BOARD_SIZE)))
+
+def mirror_bitboard(bitboard):
+    """ Bitboard reflected in the middle file, with a few delta swaps instead of one step per square """
+    for delta, mask in MIRROR_SWAPS:
+        swapped = ((bitboard >> delta) ^ bitboard) & mask
+        bitboard ^= swapped ^ (swapped << delta)
+    return bitboard
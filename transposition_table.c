@@ -1,27 +1,276 @@
+/*
+ * Bucketed transposition table shared with Python through ctypes.
+ *
+ * Build: gcc -O2 -shared -fPIC -o libtransposition_table.so transposition_table.c
+ *
+ * The table is sized at runtime with tt_init() and lives in an anonymous
+ * shared mapping, so processes forked afterwards all use the same table.
+ * Entries are grouped in buckets of BUCKET_SIZE that fill one cache line;
+ * on a full bucket the shallowest, oldest entry is replaced.
+ *
+ * Access is lockless: the stored key is the Zobrist hash XORed with the
+ * entry data, so an entry torn by concurrent writers fails the key check.
+ *
+ * tt_open() maps the table from a file instead, so it survives between
+ * runs. The header records the format version, the Zobrist seed and the
+ * table geometry; a file that does not match is reset. Pages are faulted
+ * in on demand, so opening even a large file is immediate.
+ */
 #include <stdio.h>
 #include <stdint.h>
+#include <string.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
 
-#define ENTRY_SIZE 32
-#define TABLE_SIZE (512 * 1024 * 1024 / ENTRY_SIZE)
+#define BUCKET_SIZE 4
+#define AGE_MASK 0x3F
+#define FLAG_EMPTY 0
+#define FLAG_EXACT 1
+
+/* Outcomes of a store */
+#define STORE_KEPT 0        /* a deeper entry of the position was kept */
+#define STORE_EMPTY 1       /* written to an empty slot */
+#define STORE_UPDATED 2     /* replaced the entry of the same position */
+#define STORE_OVERWRITTEN 3 /* replaced the entry of another position */
+#define TABLE_MAGIC "FIANCOTT"
+#define TABLE_VERSION 3  /* 2: keyed on the mirror-canonical hash, 3: with the weight salt of FiancoAI.table_salt */
 
 typedef struct {
-    uint64_t zobrist_hash; 
-    uint8_t start_row; uint8_t start_col; uint8_t end_row; uint8_t end_col;
-    uint8_t flag;  uint8_t score; uint8_t depth;
+    uint64_t zobrist_hash;  /* Zobrist hash ^ entry data */
+    int32_t score;
+    uint16_t move;     /* from square | to square << 7 | capture << 14, see moves.py */
+    uint8_t depth;
+    uint8_t flag_age;  /* flag in the low 2 bits, search age in the high 6 bits */
 } TranspositionEntry;
-TranspositionEntry transposition_table[TABLE_SIZE];
 
-void store(uint32_t index, uint64_t zobrist_hash, uint8_t start_row, uint8_t start_col, uint8_t end_row, uint8_t end_col, uint8_t flag, uint8_t score, uint8_t depth) {
-    TranspositionEntry *entry = &transposition_table[index];
-    entry->zobrist_hash = zobrist_hash;
-    entry->start_row = start_row; entry->start_col = start_col; entry->end_row = end_row; entry->end_col = end_col;
-    entry->flag = flag; entry->score = score; entry->depth = depth;
+typedef struct {
+    TranspositionEntry entries[BUCKET_SIZE];
+} Bucket;
+
+/* First cache line of the mapping, shared by every process using the table */
+typedef struct {
+    uint32_t age;
+    uint32_t version;
+    char magic[8];
+    uint64_t seed;      /* Zobrist seed the stored hashes were computed with */
+    uint64_t buckets;
+    uint32_t board_size;
+    uint8_t reserved[28];
+} TableHeader;
+
+static TableHeader *header = NULL;
+static Bucket *transposition_table = NULL;
+static uint64_t bucket_mask = 0;
+static size_t table_bytes = 0;
+
+
+void tt_free(void) {
+    if (header) {
+        munmap(header, table_bytes);
+        header = NULL;
+        transposition_table = NULL;
+        bucket_mask = 0;
+        table_bytes = 0;
+    }
 }
 
-TranspositionEntry* retrieve(uint32_t index, uint64_t zobrist_hash) {
-    TranspositionEntry *entry = &transposition_table[index];
-    if (entry->zobrist_hash == zobrist_hash) {
-        return entry;
+/* Largest power of two number of buckets that fits in size_mb megabytes */
+static uint64_t bucket_count(uint64_t size_mb) {
+    uint64_t buckets = 1;
+    uint64_t max_buckets = (size_mb * 1024 * 1024) / sizeof(Bucket);
+
+    while (buckets * 2 <= max_buckets) {
+        buckets *= 2;
     }
-    return NULL;
-}
\ No newline at end of file
+    return buckets;
+}
+
+static void use_mapping(void *memory, uint64_t buckets) {
+    header = (TableHeader *)memory;
+    transposition_table = (Bucket *)(header + 1);
+    bucket_mask = buckets - 1;
+}
+
+static void write_header(uint64_t buckets, uint64_t seed, uint32_t board_size) {
+    memset(header, 0, sizeof(TableHeader));
+    memcpy(header->magic, TABLE_MAGIC, sizeof(header->magic));
+    header->version = TABLE_VERSION;
+    header->seed = seed;
+    header->buckets = buckets;
+    header->board_size = board_size;
+}
+
+/* Allocate a table of at most size_mb megabytes, rounded down to a power of two buckets */
+int tt_init(uint64_t size_mb) {
+    uint64_t buckets = bucket_count(size_mb);
+    void *memory;
+
+    tt_free();
+    table_bytes = sizeof(TableHeader) + buckets * sizeof(Bucket);
+    memory = mmap(NULL, table_bytes, PROT_READ | PROT_WRITE, MAP_SHARED | MAP_ANONYMOUS, -1, 0);
+    if (memory == MAP_FAILED) {
+        table_bytes = 0;
+        return -1;
+    }
+    use_mapping(memory, buckets);
+    return 0;
+}
+
+/*
+ * Map the table from path, creating or resetting the file when its header does not
+ * match this version, seed, board size and size_mb.
+ * Returns 1 when earlier entries were kept, 0 for a fresh table and -1 on error.
+ */
+int tt_open(const char *path, uint64_t size_mb, uint64_t seed, uint32_t board_size) {
+    uint64_t buckets = bucket_count(size_mb);
+    size_t bytes = sizeof(TableHeader) + buckets * sizeof(Bucket);
+    TableHeader existing;
+    struct stat status;
+    void *memory;
+    int fd, kept = 0;
+
+    tt_free();
+    fd = open(path, O_RDWR | O_CREAT, 0644);
+    if (fd < 0) {
+        return -1;
+    }
+    if (fstat(fd, &status) == 0 && (size_t)status.st_size == bytes
+            && pread(fd, &existing, sizeof(existing), 0) == (ssize_t)sizeof(existing)) {
+        kept = memcmp(existing.magic, TABLE_MAGIC, sizeof(existing.magic)) == 0
+            && existing.version == TABLE_VERSION && existing.seed == seed
+            && existing.buckets == buckets && existing.board_size == board_size;
+    }
+    /* A stale file is truncated and regrown sparse, which zeroes every entry */
+    if (!kept && (ftruncate(fd, 0) != 0 || ftruncate(fd, bytes) != 0)) {
+        close(fd);
+        return -1;
+    }
+    memory = mmap(NULL, bytes, PROT_READ | PROT_WRITE, MAP_SHARED, fd, 0);
+    close(fd);
+    if (memory == MAP_FAILED) {
+        return -1;
+    }
+    table_bytes = bytes;
+    use_mapping(memory, buckets);
+    if (!kept) {
+        write_header(buckets, seed, board_size);
+    }
+    return kept;
+}
+
+/* Write dirty pages of a file-backed table back to disk */
+int tt_sync(void) {
+    return header ? msync(header, table_bytes, MS_SYNC) : 0;
+}
+
+void tt_clear(void) {
+    if (header) {
+        memset(transposition_table, 0, table_bytes - sizeof(TableHeader));
+        header->age = 0;
+    }
+}
+
+/* Start a new search: entries from older searches become preferred replacement victims */
+void tt_new_search(void) {
+    if (header) {
+        header->age = (header->age + 1) & AGE_MASK;
+    }
+}
+
+uint64_t tt_entries(void) {
+    return transposition_table ? (bucket_mask + 1) * BUCKET_SIZE : 0;
+}
+
+static int64_t pack_entry(const TranspositionEntry *entry) {
+    return ((int64_t)entry->score * ((int64_t)1 << 32))
+        | ((int64_t)entry->depth << 24)
+        | ((int64_t)(entry->flag_age & 3) << 16)
+        | entry->move;
+}
+
+static uint64_t entry_data(const TranspositionEntry *entry) {
+    uint64_t data;
+    memcpy(&data, &entry->score, sizeof(data));
+    return data;
+}
+
+static int32_t replacement_value(const TranspositionEntry *entry, uint8_t age) {
+    return (int32_t)entry->depth - 8 * (int32_t)((age - (entry->flag_age >> 2)) & AGE_MASK);
+}
+
+/*
+ * Single entry point for Python.
+ * store == 0: probe, returns 0 on a miss or the entry packed as
+ *             score << 32 | depth << 24 | flag << 16 | move (flag is never 0 for a hit).
+ * store != 0: store the entry and return one of the STORE_* outcomes.
+ */
+int64_t tt_probe_or_store(uint64_t zobrist_hash, int32_t store, uint32_t move, int32_t flag, int32_t score, int32_t depth) {
+    TranspositionEntry *bucket, *entry, *victim;
+    uint8_t age;
+    int i, outcome = STORE_OVERWRITTEN;
+
+    if (!transposition_table) {
+        return 0;
+    }
+    age = (uint8_t)header->age;
+    bucket = transposition_table[zobrist_hash & bucket_mask].entries;
+
+    if (!store) {
+        for (i = 0; i < BUCKET_SIZE; i++) {
+            entry = &bucket[i];
+            if ((entry->zobrist_hash ^ entry_data(entry)) == zobrist_hash && (entry->flag_age & 3) != FLAG_EMPTY) {
+                return pack_entry(entry);
+            }
+        }
+        return 0;
+    }
+
+    victim = &bucket[0];
+    for (i = 0; i < BUCKET_SIZE; i++) {
+        entry = &bucket[i];
+        if ((entry->flag_age & 3) == FLAG_EMPTY) {
+            victim = entry;
+            outcome = STORE_EMPTY;
+            break;
+        }
+        if ((entry->zobrist_hash ^ entry_data(entry)) == zobrist_hash) {
+            /* Keep a deeper result of the current search unless the new one is exact */
+            if (flag != FLAG_EXACT && depth + 2 < entry->depth && (entry->flag_age >> 2) == age) {
+                return STORE_KEPT;
+            }
+            if (!move) {
+                move = entry->move;
+            }
+            victim = entry;
+            outcome = STORE_UPDATED;
+            break;
+        }
+        if (replacement_value(entry, age) < replacement_value(victim, age)) {
+            victim = entry;
+        }
+    }
+
+    victim->score = score;
+    victim->move = (uint16_t)move;
+    victim->depth = (uint8_t)(depth < 0 ? 0 : depth > 255 ? 255 : depth);
+    victim->flag_age = (uint8_t)((age << 2) | (flag & 3));
+    victim->zobrist_hash = zobrist_hash ^ entry_data(victim);
+    return outcome;
+}
+
+/* Batch variants: one ctypes call for a whole array of positions */
+void tt_probe_many(const uint64_t *zobrist_hashes, int64_t *packed, uint64_t count) {
+    uint64_t i;
+    for (i = 0; i < count; i++) {
+        packed[i] = tt_probe_or_store(zobrist_hashes[i], 0, 0, 0, 0, 0);
+    }
+}
+
+void tt_store_many(const uint64_t *zobrist_hashes, const uint32_t *moves, const int32_t *flags, const int32_t *scores, const int32_t *depths, uint64_t count) {
+    uint64_t i;
+    for (i = 0; i < count; i++) {
+        tt_probe_or_store(zobrist_hashes[i], 1, moves[i], flags[i], scores[i], depths[i]);
+    }
+}
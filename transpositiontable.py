@@ -1,27 +1,158 @@
 import ctypes
 import psutil
 import os
-from ctypes import c_uint64, c_uint8, c_uint32, Structure, CDLL, POINTER
-
-lib = CDLL('./libtransposition_table.so')
-class TranspositionEntry(Structure):
-    _fields_ = [
-        ('zobrist_hash', c_uint64),
-        ('start_row',c_uint8), ('start_col',c_uint8),('end_row',c_uint8),('end_col',c_uint8),
-        ('flag', c_uint8),('score', c_uint8),('depth', c_uint8),
-    ]
-
-lib.store.argtypes = [c_uint32, c_uint64, c_uint8, c_uint8, c_uint8,c_uint8, c_uint8, c_uint8, c_uint8]
-lib.store.restype = None
-lib.retrieve.argtypes = [c_uint32, c_uint64]
-lib.retrieve.restype = POINTER(TranspositionEntry)
-
-def store_entry(index, zobrist_hash, start_row, start_col, end_row, end_col, flag, score, depth):
-    lib.store(index, zobrist_hash, start_row, start_col, end_row, end_col, flag, score, depth)
-
-def retrieve_entry(index, zobrist_hash):
-    entry_ptr = lib.retrieve(index, zobrist_hash)
-    if entry_ptr:
-        return entry_ptr.contents
+import numpy as np
+from ctypes import c_char_p, c_int32, c_int64, c_uint32, c_uint64, c_int, c_void_p, CDLL
+from parameters import BOARD_SIZE, SEED, TT_FILE, TT_SIZE_MB
+from moves import encode_move, decode_move
+from numpytable import NumpyTranspositionTable
+
+# Entry flags
+FLAG_EXACT = 1
+FLAG_LOWER = 2
+FLAG_UPPER = 3
+
+# Outcomes returned by store
+STORE_KEPT = 0
+STORE_EMPTY = 1
+STORE_UPDATED = 2
+STORE_OVERWRITTEN = 3
+
+LIBRARY_NAME = 'libtransposition_table.so'
+
+# SearchStats counting probes and stores, set by attach_stats
+stats = None
+
+def requested_size_mb():
+    """ Table size from FIANCO_TT_MB or parameters.TT_SIZE_MB """
+    return max(1, int(os.environ.get('FIANCO_TT_MB', TT_SIZE_MB)))
+
+def table_size_mb():
+    """ Requested size of an in-memory table, capped at a quarter of the available memory """
+    return max(1, min(requested_size_mb(), psutil.virtual_memory().available // (4 * 1024 * 1024)))
+
+def table_file():
+    """ Path of the persistent table from FIANCO_TT_FILE or parameters.TT_FILE, None for an in-memory table """
+    return os.environ.get('FIANCO_TT_FILE', TT_FILE) or None
+
+def load_library():
+    """ Load the C table from next to this module or from the working directory """
+    for directory in (os.path.dirname(os.path.abspath(__file__)), os.getcwd()):
+        try:
+            return CDLL(os.path.join(directory, LIBRARY_NAME))
+        except OSError:
+            continue
     return None
 
+lib = load_library()
+
+if lib is not None:
+    BACKEND = 'c'
+    lib.tt_init.argtypes = [c_uint64]
+    lib.tt_init.restype = c_int
+    lib.tt_open.argtypes = [c_char_p, c_uint64, c_uint64, c_uint32]
+    lib.tt_open.restype = c_int
+    lib.tt_sync.argtypes = []
+    lib.tt_sync.restype = c_int
+    lib.tt_free.argtypes = []
+    lib.tt_free.restype = None
+    lib.tt_clear.argtypes = []
+    lib.tt_clear.restype = None
+    lib.tt_new_search.argtypes = []
+    lib.tt_new_search.restype = None
+    lib.tt_entries.argtypes = []
+    lib.tt_entries.restype = c_uint64
+    lib.tt_probe_or_store.argtypes = [c_uint64, c_int32, c_uint32, c_int32, c_int32, c_int32]
+    lib.tt_probe_or_store.restype = c_int64
+    lib.tt_probe_many.argtypes = [c_void_p, c_void_p, c_uint64]
+    lib.tt_probe_many.restype = None
+    lib.tt_store_many.argtypes = [c_void_p, c_void_p, c_void_p, c_void_p, c_void_p, c_uint64]
+    lib.tt_store_many.restype = None
+
+    resize_table, clear_table, new_search, table_entries = lib.tt_init, lib.tt_clear, lib.tt_new_search, lib.tt_entries
+    probe_or_store, sync_table = lib.tt_probe_or_store, lib.tt_sync
+
+    def open_file(path, size_mb, seed, board_size):
+        return lib.tt_open(os.fsencode(path), size_mb, seed, board_size)
+
+    def probe_many(zobrist_hashes):
+        """ Packed entries for an array of hashes, 0 where the table has no entry """
+        zobrist_hashes = np.ascontiguousarray(zobrist_hashes, dtype=np.uint64)
+        packed = np.empty(len(zobrist_hashes), dtype=np.int64)
+        lib.tt_probe_many(zobrist_hashes.ctypes.data, packed.ctypes.data, len(zobrist_hashes))
+        return packed
+
+    def store_many(zobrist_hashes, moves, flags, scores, depths):
+        arrays = [np.ascontiguousarray(zobrist_hashes, dtype=np.uint64), np.ascontiguousarray(moves, dtype=np.uint32)]
+        arrays += [np.ascontiguousarray(values, dtype=np.int32) for values in (flags, scores, depths)]
+        lib.tt_store_many(*(array.ctypes.data for array in arrays), len(arrays[0]))
+else:
+    # No compiled library on this host, fall back to the NumPy implementation
+    BACKEND = 'numpy'
+    table = NumpyTranspositionTable(1)
+
+    resize_table, clear_table, new_search, table_entries = table.resize, table.clear, table.new_search, table.entries
+    probe_or_store, sync_table, open_file = table.probe_or_store, table.sync, table.open
+    probe_many, store_many = table.probe_many, table.store_many
+
+def init_table(size_mb=None, path=None):
+    """ Allocate the table in memory, or map it from path to keep it between runs
+
+        Returns True when a file table kept the entries of an earlier run.
+    """
+    if path:
+        return open_table(path, size_mb)
+    if resize_table(size_mb or table_size_mb()) != 0:
+        raise MemoryError("Could not allocate the transposition table")
+    return False
+
+def open_table(path, size_mb=None):
+    """ Map the table from a file, reset when it was written with another version, Zobrist seed or size
+
+        The file is paged in on demand, so its size is not capped by the available memory.
+        Returns True when the entries of an earlier run were kept.
+    """
+    kept = open_file(path, size_mb or requested_size_mb(), SEED, BOARD_SIZE)
+    if kept < 0:
+        raise OSError(f"Could not map the transposition table file {path}")
+    return kept == 1
+
+def attach_stats(search_stats):
+    """ Count probes, hits, stores and overwrites in search_stats, None to stop counting """
+    global stats
+    stats = search_stats
+
+def store(zobrist_hash, move, flag, score, depth):
+    """ Store an entry with an encoded move (see moves.py), returns one of the STORE_* outcomes """
+    outcome = probe_or_store(zobrist_hash, 1, move, flag, score, depth)
+    if stats:
+        stats.tt_stores += 1
+        stats.tt_overwrites += outcome == STORE_OVERWRITTEN
+    return outcome
+
+def probe(zobrist_hash):
+    """ Return (move, flag, score, depth) with an encoded move, or None on a miss """
+    packed = probe_or_store(zobrist_hash, 0, 0, 0, 0, 0)
+    if stats:
+        stats.tt_probes += 1
+        stats.tt_hits += packed != 0
+    if not packed:
+        return None
+    return packed & 0xFFFF, (packed >> 16) & 0xFF, packed >> 32, (packed >> 24) & 0xFF
+
+def store_entry(zobrist_hash, start_row, start_col, end_row, end_col, flag, score, depth):
+    probe_or_store(zobrist_hash, 1, encode_move(start_row, start_col, end_row, end_col), flag, score, depth)
+
+def retrieve_entry(zobrist_hash):
+    """ Return (start_row, start_col, end_row, end_col, flag, score, depth) or None on a miss """
+    packed = probe_or_store(zobrist_hash, 0, 0, 0, 0, 0)
+    if not packed:
+        return None
+    return decode_move(packed & 0xFFFF) + ((packed >> 16) & 0xFF, packed >> 32, (packed >> 24) & 0xFF)
+
+def unpack_entries(packed):
+    """ Split packed entries from probe_many into (moves, flags, scores, depths) arrays """
+    packed = np.asarray(packed, dtype=np.int64)
+    return packed & 0xFFFF, (packed >> 16) & 0xFF, packed >> 32, (packed >> 24) & 0xFF
+
+init_table(path=table_file())
@@ -0,0 +1,133 @@
+"""
+    Texel-style tuning of the evaluation weights on recorded games
+
+    extract: replay game records (see gamerecord.py) and append every quiet position to a flat
+             file of POSITION_DTYPE rows: both bitboards as (low, high) uint64 words and the
+             game result for white (0 loss, 1 draw, 2 win).
+    fit:     fit the weights so that sigmoid(score / scale) predicts the result. The file is
+             memory-mapped and read in chunks, the features of a chunk are computed at once
+             with vectorboard.py and each chunk gives one batched gradient step, so the data
+             may exceed RAM.
+"""
+import argparse
+import json
+import time
+import numpy as np
+import vectorboard
+from evaluation import FEATURES, weight_vector
+from gamerecord import RESULT_NONE, read_games, replay
+from parameters import EVAL_WEIGHTS
+
+POSITION_DTYPE = np.dtype([('white', '<u8', 2), ('black', '<u8', 2), ('result', 'u1')])
+CHUNK_ROWS = 1 << 20
+
+def extract(records_path, output_path, skip_plies=4, chunk_rows=CHUNK_ROWS):
+    """ Append the quiet positions of every recorded game to output_path, returns the number of positions
+
+        The first skip_plies of each game and positions with a capture pending are left out:
+        their static evaluation says little about the outcome.
+    """
+    rows = np.zeros(chunk_rows, dtype=POSITION_DTYPE)
+    count = written = 0
+    with open(output_path, 'ab') as output:
+        for record in read_games(records_path):
+            result = 1 if record.result == RESULT_NONE else 2 if record.result == 1 else 0
+            for ply, (board, _) in enumerate(replay(record)):
+                if ply < skip_plies or board.has_captures():
+                    continue
+                row = rows[count]
+                row['white'] = vectorboard.split(board.white_pieces)
+                row['black'] = vectorboard.split(board.black_pieces)
+                row['result'] = result
+                count += 1
+                if count == chunk_rows:
+                    rows.tofile(output)
+                    written += count
+                    count = 0
+        rows[:count].tofile(output)
+    return written + count
+
+def load(path):
+    """ Positions of an extracted file as a read-only memory map """
+    return np.memmap(path, dtype=POSITION_DTYPE, mode='r')
+
+def chunks(data, chunk_rows=CHUNK_ROWS):
+    """ Yield (features, targets) as float arrays, one chunk of the memory map at a time """
+    for start in range(0, len(data), chunk_rows):
+        chunk = np.asarray(data[start:start + chunk_rows])
+        white, black = chunk['white'], chunk['black']
+        x = vectorboard.features(white[:, 0], white[:, 1], black[:, 0], black[:, 1]).astype(np.float64)
+        yield x, chunk['result'] / 2
+
+def sigmoid(x, weights, scale):
+    return 1 / (1 + np.exp(np.clip(-(x @ weights) / scale, -500, 500)))
+
+def loss(data, weights, scale, chunk_rows=CHUNK_ROWS):
+    """ Mean squared error between the predicted and the actual results """
+    total = 0.0
+    for x, y in chunks(data, chunk_rows):
+        total += np.sum((sigmoid(x, weights, scale) - y) ** 2)
+    return total / max(len(data), 1)
+
+def fit_scale(data, weights, chunk_rows=CHUNK_ROWS):
+    """ Scale of the sigmoid that best fits the given weights, by a coarse-to-fine search """
+    best = 100.0
+    for step in (64.0, 16.0, 4.0, 1.0):
+        candidates = [max(best + step * i, 1.0) for i in range(-4, 5)]
+        best = min(candidates, key=lambda scale: loss(data, weights, scale, chunk_rows))
+    return best
+
+def fit(data, weights, scale, epochs=20, learning_rate=1.0, fixed=('material',), chunk_rows=CHUNK_ROWS, verbose=True):
+    """ Adam steps on the squared error, one per chunk; the weights of the fixed features are kept
+
+        Keeping material fixed pins the units of the score, otherwise all weights and the
+        scale could grow together.
+    """
+    weights = np.array(weights, dtype=np.float64)
+    free = np.array([name not in fixed for name in FEATURES], dtype=np.float64)
+    moment, velocity, steps = np.zeros_like(weights), np.zeros_like(weights), 0
+    for epoch in range(epochs):
+        start = time.perf_counter()
+        for x, y in chunks(data, chunk_rows):
+            predicted = sigmoid(x, weights, scale)
+            error = (predicted - y) * predicted * (1 - predicted)
+            gradient = 2 * (x.T @ error) / (scale * len(y)) * free
+            steps += 1
+            moment = 0.9 * moment + 0.1 * gradient
+            velocity = 0.999 * velocity + 0.001 * gradient ** 2
+            weights -= learning_rate * (moment / (1 - 0.9 ** steps)) / (np.sqrt(velocity / (1 - 0.999 ** steps)) + 1e-12)
+        if verbose:
+            print(f"epoch {epoch + 1}: loss {loss(data, weights, scale, chunk_rows):.6f} in {time.perf_counter() - start:.1f}s "
+                  + json.dumps(dict(zip(FEATURES, np.round(weights, 2).tolist()))), flush=True)
+    return weights
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune the evaluation weights on recorded games")
+    commands = parser.add_subparsers(dest='command', required=True)
+    extract_parser = commands.add_parser('extract', help="append the positions of a game record file to a data file")
+    extract_parser.add_argument('records')
+    extract_parser.add_argument('output')
+    extract_parser.add_argument('--skip-plies', type=int, default=4)
+    fit_parser = commands.add_parser('fit', help="fit the weights on a data file and print them as JSON")
+    fit_parser.add_argument('data')
+    fit_parser.add_argument('--weights', default=None, help="starting weights as JSON, EVAL_WEIGHTS by default")
+    fit_parser.add_argument('--scale', type=float, default=None, help="sigmoid scale, fitted to the starting weights by default")
+    fit_parser.add_argument('--epochs', type=int, default=20)
+    fit_parser.add_argument('--learning-rate', type=float, default=1.0)
+    fit_parser.add_argument('--fixed', default='material', help="comma-separated features whose weight is kept")
+    fit_parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    if args.command == 'extract':
+        print(f"{extract(args.records, args.output, args.skip_plies)} positions appended to {args.output}")
+        return
+    data = load(args.data)
+    weights = np.array(weight_vector(json.loads(args.weights) if args.weights else EVAL_WEIGHTS), dtype=np.float64)
+    scale = args.scale or fit_scale(data, weights, args.chunk_rows)
+    print(f"{len(data)} positions, scale {scale}, loss {loss(data, weights, scale, args.chunk_rows):.6f}")
+    fixed = tuple(name for name in args.fixed.split(',') if name)
+    weights = fit(data, weights, scale, args.epochs, args.learning_rate, fixed, args.chunk_rows)
+    print(json.dumps(dict(zip(FEATURES, np.round(weights).astype(int).tolist()))))
+
+if __name__ == "__main__":
+    main()
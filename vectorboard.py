@@ -0,0 +1,215 @@
+"""
+    NumPy bitboards: many positions at once, each bitboard split into two uint64 words
+
+    A bitboard of SQUARES bits is held as a (low, high) pair of uint64 arrays, low for
+    squares 0-63 and high for the rest, so whole-board shifts, masks and popcounts run on a
+    batch of positions with a handful of array operations.
+"""
+import numpy as np
+from evaluation import ADVANCEMENT_PLANES
+from parameters import BOARD_SIZE
+from tables import (FULL_BOARD, NOT_FIRST_FILE, NOT_FIRST_TWO_FILES, NOT_LAST_FILE, NOT_LAST_TWO_FILES,
+                    PROMOTION_ROW, SQUARE_BIT, SQUARES)
+
+WORD_BITS = 64
+LOW_MASK = (1 << WORD_BITS) - 1
+HIGH_MASK = np.uint64(FULL_BOARD >> WORD_BITS)
+
+def split(bitboard):
+    """ (low, high) uint64 scalars of an int bitboard """
+    return np.uint64(bitboard & LOW_MASK), np.uint64(bitboard >> WORD_BITS)
+
+def join(low, high):
+    """ int bitboard of one (low, high) pair """
+    return int(low) | int(high) << WORD_BITS
+
+def from_ints(bitboards):
+    """ (low, high) arrays of a sequence of int bitboards """
+    low = np.fromiter((bitboard & LOW_MASK for bitboard in bitboards), dtype=np.uint64)
+    high = np.fromiter((bitboard >> WORD_BITS for bitboard in bitboards), dtype=np.uint64)
+    return low, high
+
+def shift_up(low, high, n):
+    """ Shift towards higher squares by 0 < n < 64 bits, bits past the board are dropped """
+    n = np.uint64(n)
+    return low << n, ((high << n) | (low >> (np.uint64(WORD_BITS) - n))) & HIGH_MASK
+
+def shift_down(low, high, n):
+    """ Shift towards lower squares by 0 < n < 64 bits """
+    n = np.uint64(n)
+    return (low >> n) | (high << (np.uint64(WORD_BITS) - n)), high >> n
+
+def popcount(low, high):
+    return np.bitwise_count(low).astype(np.int64) + np.bitwise_count(high)
+
+NOT_FIRST_FILE_WORDS = split(NOT_FIRST_FILE)
+NOT_LAST_FILE_WORDS = split(NOT_LAST_FILE)
+ADVANCEMENT_PLANE_WORDS = [0] + [[split(plane) for plane in ADVANCEMENT_PLANES[player]] for player in (1, 2)]
+
+def spread(low, high):
+    """ The bitboards together with their left and right neighbours """
+    left_low, left_high = shift_up(low, high, 1)
+    right_low, right_high = shift_down(low, high, 1)
+    return (
+        low | (left_low & NOT_FIRST_FILE_WORDS[0]) | (right_low & NOT_LAST_FILE_WORDS[0]),
+        high | (left_high & NOT_FIRST_FILE_WORDS[1]) | (right_high & NOT_LAST_FILE_WORDS[1]),
+    )
+
+def advancement(low, high, player):
+    total = np.zeros(low.shape, dtype=np.int64)
+    for bit, (plane_low, plane_high) in enumerate(ADVANCEMENT_PLANE_WORDS[player]):
+        total += popcount(low & plane_low, high & plane_high) << bit
+    return total
+
+def runners(low, high, front_low, front_high, player):
+    """ Pieces of player outside the cone of every enemy piece in front, see evaluation.white_runners """
+    shift = shift_down if player == 1 else shift_up
+    for _ in range(BOARD_SIZE - 1):
+        front_low, front_high = spread(*shift(front_low, front_high, BOARD_SIZE))
+        low, high = low & ~front_low, high & ~front_high
+    return low, high
+
+def features(white_low, white_high, black_low, black_high):
+    """ evaluation.features of every position, as an int64 array of shape (positions, len(FEATURES)) """
+    return np.stack((
+        popcount(white_low, white_high) - popcount(black_low, black_high),
+        advancement(white_low, white_high, 1) - advancement(black_low, black_high, 2),
+        popcount(*runners(white_low, white_high, black_low, black_high, 1))
+        - popcount(*runners(black_low, black_high, white_low, white_high, 2)),
+    ), axis=1)
+
+# Batch playouts: each game of a batch has its own position and player to move. Moves are
+# generated per direction as target bitboards, like Chessboard.capture_targets and
+# quiet_targets, for both players at once with the pieces of the player not to move masked out.
+
+# (player, step from the start square to the target, mask of the start squares, capture)
+DIRECTIONS = (
+    (1, 2 * (BOARD_SIZE + 1), NOT_LAST_TWO_FILES, True),
+    (1, 2 * (BOARD_SIZE - 1), NOT_FIRST_TWO_FILES, True),
+    (2, -2 * (BOARD_SIZE - 1), NOT_LAST_TWO_FILES, True),
+    (2, -2 * (BOARD_SIZE + 1), NOT_FIRST_TWO_FILES, True),
+    (1, BOARD_SIZE, FULL_BOARD, False),
+    (2, -BOARD_SIZE, FULL_BOARD, False),
+    (0, 1, NOT_LAST_FILE, False),
+    (0, -1, NOT_FIRST_FILE, False),
+)
+CAPTURE_DIRECTIONS = sum(1 for direction in DIRECTIONS if direction[3])
+DIRECTION_STEPS = np.array([step for _, step, _, _ in DIRECTIONS], dtype=np.int64)
+DIRECTION_MASKS = [split(mask) for _, _, mask, _ in DIRECTIONS]
+
+# (low, high) words of every square, index SQUARES is the empty bitboard
+SQUARE_LOW = np.array([SQUARE_BIT[square] & LOW_MASK for square in range(SQUARES)] + [0], dtype=np.uint64)
+SQUARE_HIGH = np.array([SQUARE_BIT[square] >> WORD_BITS for square in range(SQUARES)] + [0], dtype=np.uint64)
+PROMOTION_WORDS = [0] + [split(PROMOTION_ROW[player]) for player in (1, 2)]
+
+def shift(low, high, step):
+    return shift_up(low, high, step) if step > 0 else shift_down(low, high, -step)
+
+def winners(white_low, white_high, black_low, black_high):
+    """ Chessboard.check_winner of every position: 1 or 2 for a piece on its last row, else 0 """
+    white_low_row, white_high_row = PROMOTION_WORDS[1]
+    black_low_row, black_high_row = PROMOTION_WORDS[2]
+    white_won = ((white_low & white_low_row) | (white_high & white_high_row)) != 0
+    black_won = ((black_low & black_low_row) | (black_high & black_high_row)) != 0
+    return np.where(white_won, 1, np.where(black_won, 2, 0)).astype(np.int8)
+
+def legal_targets(white_low, white_high, black_low, black_high, player):
+    """ Target bitboards of the legal moves of every game, one row per DIRECTIONS entry
+
+        Returns (low, high, counts), each of shape (len(DIRECTIONS), games). Quiet moves are
+        left out of the games that have a capture, captures being mandatory.
+    """
+    white_moves = player == 1
+    mover_low, mover_high = np.where(white_moves, white_low, black_low), np.where(white_moves, white_high, black_high)
+    enemy_low, enemy_high = np.where(white_moves, black_low, white_low), np.where(white_moves, black_high, white_high)
+    empty_low, empty_high = ~(white_low | black_low), ~(white_high | black_high) & HIGH_MASK
+    low = np.empty((len(DIRECTIONS), len(player)), dtype=np.uint64)
+    high = np.empty_like(low)
+    for i, ((direction_player, step, _, capture), (mask_low, mask_high)) in enumerate(zip(DIRECTIONS, DIRECTION_MASKS)):
+        pieces_low, pieces_high = mover_low & mask_low, mover_high & mask_high
+        if direction_player:
+            pieces_low, pieces_high = np.where(player == direction_player, pieces_low, 0), np.where(player == direction_player, pieces_high, 0)
+        if capture:
+            jumped_low, jumped_high = shift(pieces_low, pieces_high, step // 2)
+            pieces_low, pieces_high = shift(jumped_low & enemy_low, jumped_high & enemy_high, step // 2)
+        else:
+            pieces_low, pieces_high = shift(pieces_low, pieces_high, step)
+        low[i], high[i] = pieces_low & empty_low, pieces_high & empty_high
+    counts = np.bitwise_count(low).astype(np.int64) + np.bitwise_count(high)
+    counts[CAPTURE_DIRECTIONS:, counts[:CAPTURE_DIRECTIONS].any(axis=0)] = 0
+    return low, high, counts
+
+def random_moves(low, high, counts, rng):
+    """ (start square, target square, captured square) of a uniformly random legal move per game
+
+        Squares are SQUARES where there is none: no capture, or no legal move at all.
+    """
+    games = np.arange(counts.shape[1])
+    cumulative = counts.cumsum(axis=0)
+    choice = (rng.random(len(games)) * cumulative[-1]).astype(np.int64)
+    direction = np.minimum((cumulative <= choice).sum(axis=0), len(DIRECTIONS) - 1)
+    nth = choice - cumulative[direction, games] + counts[direction, games]
+    # Square of the nth set bit of the chosen target bitboard: find the word, then clear lower bits
+    target_low, target_high = low[direction, games], high[direction, games]
+    low_count = np.bitwise_count(target_low).astype(np.int64)
+    in_low = nth < low_count
+    word = np.where(in_low, target_low, target_high)
+    nth = np.where(in_low, nth, nth - low_count)
+    for i in range(int(nth.max(initial=0))):
+        word = np.where(nth > i, word & (word - np.uint64(1)), word)
+    target = np.bitwise_count((word & (~word + np.uint64(1))) - np.uint64(1)).astype(np.int64) + np.where(in_low, 0, WORD_BITS)
+    start = target - DIRECTION_STEPS[direction]
+    captured = np.where(direction < CAPTURE_DIRECTIONS, (start + target) >> 1, SQUARES)
+    none = cumulative[-1] == 0
+    return np.where(none, SQUARES, start), np.where(none, SQUARES, target), np.where(none, SQUARES, captured)
+
+def play(white_low, white_high, black_low, black_high, player, start, target, captured):
+    """ Positions after the given moves, the player to move is flipped """
+    moved_low, moved_high = SQUARE_LOW[start] | SQUARE_LOW[target], SQUARE_HIGH[start] | SQUARE_HIGH[target]
+    captured_low, captured_high = SQUARE_LOW[captured], SQUARE_HIGH[captured]
+    white_moves = player == 1
+    return (
+        white_low ^ np.where(white_moves, moved_low, captured_low),
+        white_high ^ np.where(white_moves, moved_high, captured_high),
+        black_low ^ np.where(white_moves, captured_low, moved_low),
+        black_high ^ np.where(white_moves, captured_high, moved_high),
+        player ^ 3,
+    )
+
+def playouts(white_low, white_high, black_low, black_high, player, rng, max_plies, weights=None, scale=1.0):
+    """ Play every game with uniformly random legal moves, all in lockstep, returns the score of every game for white
+
+        As in Chessboard, a game ends when a piece reaches its last row or the player to
+        move has no legal move, which loses: white scores 1 for a win and 0 for a loss.
+        Games still running after max_plies score sigmoid(evaluation / scale) with the
+        evaluation weights in FEATURES order, or 0.5 without weights.
+    """
+    position = [np.array(words, dtype=np.uint64) for words in (white_low, white_high, black_low, black_high)]
+    player = np.array(player, dtype=np.int8)
+    result = winners(*position)
+    live = np.flatnonzero(result == 0)
+    position = [words[live] for words in position]
+    player = player[live]
+    for _ in range(max_plies):
+        if not live.size:
+            break
+        low, high, counts = legal_targets(*position, player)
+        stuck = counts.sum(axis=0) == 0
+        result[live[stuck]] = player[stuck] ^ 3
+        *position, player = play(*position, player, *random_moves(low, high, counts, rng))
+        finished = winners(*position)
+        result[live] = np.where(stuck, result[live], finished)
+        # Keep only the games still running, so each ply costs less as games end
+        running = (finished == 0) & ~stuck
+        live = live[running]
+        position = [words[running] for words in position]
+        player = player[running]
+
+    scores = (result == 1).astype(np.float64)
+    if live.size:
+        if weights is None:
+            scores[live] = 0.5
+        else:
+            evaluation = features(*position) @ np.asarray(weights, dtype=np.float64)
+            scores[live] = 1 / (1 + np.exp(np.clip(-evaluation / scale, -500, 500)))
+    return scores